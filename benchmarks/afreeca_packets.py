@@ -0,0 +1,83 @@
+"""Benchmark decoding of Afreeca (Soop) chat packets.
+
+Compares the original decoder (which decodes the whole body, falling back to
+splitting it on whitespace) with `decode_packet`, over a synthetic stream of
+chat packets. Some packets contain an EUC-KR encoded field.
+
+Usage: python benchmarks/afreeca_packets.py [number of packets]
+"""
+import os
+import random
+import sys
+import time
+
+# Allow direct execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
+
+from chat_downloader.sites.afreeca.constants import ServiceCode
+from chat_downloader.sites.afreeca.packet import create_packet, decode_packet
+
+
+def legacy_decode(data):
+    header = data[:14]
+    body = data[14:]
+
+    svc = int(header[2:6])
+    ret_code = int(header[12:14])
+
+    packet = []
+    try:
+        packet = body.decode("utf-8").strip().split("\f")
+    except UnicodeDecodeError:
+        for packet_part in body.split():
+            try:
+                packet.append(packet_part.decode("utf-8"))
+            except UnicodeDecodeError:
+                packet.append(packet_part.decode("euc-kr"))
+
+    return svc, ret_code, packet
+
+
+def generate_packets(count, euc_kr_ratio=0.05):
+    rng = random.Random(0)
+    words = ['안녕하세요', 'ㅋㅋㅋㅋ', 'hello', '방송', 'GG', '최고', '👍']
+
+    packets = []
+    for i in range(count):
+        message = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+        fields = [message, f'user{i % 500}', '0', '3', '0', f'닉네임{i % 500}', '537395744|163840', '-1', '16777215']
+
+        packet = create_packet(ServiceCode.SVC_CHATMESG, fields)
+        if rng.random() < euc_kr_ratio:  # Replace the nickname with an EUC-KR one
+            packet = packet.replace(fields[5].encode('utf-8'), fields[5].encode('euc-kr'))
+        packets.append(packet)
+
+    return packets
+
+
+def benchmark(function, packets, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for packet in packets:
+            function(packet)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    packets = generate_packets(count)
+
+    for name, function in (('legacy', legacy_decode), ('current', decode_packet)):
+        elapsed = benchmark(function, packets)
+        print(f'{name:>10}: {elapsed / count * 1e6:6.2f} us/packet '
+              f'({count / elapsed:,.0f} packets/s)')
+
+    # The legacy fallback splits on whitespace, breaking the field layout
+    mismatches = sum(legacy_decode(packet) != decode_packet(packet) for packet in packets)
+    print(f'{mismatches} packets decoded differently (EUC-KR fields)')
+
+
+if __name__ == '__main__':
+    main()
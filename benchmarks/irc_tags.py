@@ -0,0 +1,92 @@
+"""Benchmark parsing of Twitch IRC messages (and their tags).
+
+Parses a synthetic stream of chat lines with `_parse_irc_line`, and the tags
+of the same lines with `_parse_irc_tags` alone. Lines vary in their author,
+badges, emotes and replies, and some contain a tag which has not been seen
+before, as the server may add new tags at any time. A pool of distinct lines
+is generated up front and cycled through, so that the benchmark measures the
+parser rather than the generation of lines.
+
+Usage: python benchmarks/irc_tags.py [number of lines]
+"""
+import os
+import random
+import sys
+import time
+
+# Allow direct execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
+
+from chat_downloader.sites.twitch import TwitchChatDownloader
+
+
+def generate_lines(count, unknown_tag_ratio=0.01):
+    rng = random.Random(0)
+    words = ['hello', 'GG', 'lol', 'Kappa', 'pog', 'what', 'chat', ':)']
+    badges = ['subscriber/12', 'premium/1', 'moderator/1', 'bits/100', 'vip/1']
+
+    lines = []
+    for i in range(count):
+        user = f'user{i % 5000}'
+        message = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+        tags = {
+            'badge-info': 'subscriber/12',
+            'badges': ','.join(rng.sample(badges, rng.randint(0, 3))),
+            'color': f'#{rng.randrange(1 << 24):06X}',
+            'display-name': user.capitalize(),
+            'emotes': '25:0-4' if message.startswith('Kappa') else '',
+            'first-msg': '0',
+            'flags': '',
+            'id': f'{i:08x}-0000-0000-0000-000000000000',
+            'mod': '0',
+            'returning-chatter': '0',
+            'room-id': '12345',
+            'subscriber': '1',
+            'tmi-sent-ts': str(1_600_000_000_000 + i),
+            'turbo': '0',
+            'user-id': str(i % 5000),
+            'user-type': ''
+        }
+        if rng.random() < 0.1:
+            tags.update({
+                'reply-parent-display-name': 'Other',
+                'reply-parent-msg-body': 'original\\smessage',
+                'reply-parent-msg-id': f'{i:08x}-1111-0000-0000-000000000000',
+                'reply-parent-user-id': '1',
+                'reply-parent-user-login': 'other'
+            })
+        if rng.random() < unknown_tag_ratio:
+            tags[f'experiment-{i}'] = '1'
+
+        tag_text = ';'.join(f'{key}={value}' for key, value in tags.items())
+        lines.append(f'@{tag_text} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #channel :{message}')
+
+    return lines
+
+
+def benchmark(function, inputs, count):
+    start = time.perf_counter()
+    for i in range(count):
+        function(inputs[i % len(inputs)])
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = generate_lines(min(count, 10000))
+    tags = [line[1:line.index(' :')] for line in lines]
+
+    cases = (
+        ('line', TwitchChatDownloader._parse_irc_line, lines),
+        ('tags', TwitchChatDownloader._parse_irc_tags, tags),
+    )
+    for name, function, inputs in cases:
+        elapsed = benchmark(function, inputs, count)
+        print(f'{name:>5}: {elapsed / count * 1e6:6.2f} us/line ({count / elapsed:,.0f} lines/s)')
+
+    print(f'known tags: {len(TwitchChatDownloader._IRC_TAG_TABLE)}, '
+          f'cached unknown tags: {len(TwitchChatDownloader._UNKNOWN_IRC_TAGS)}')
+
+
+if __name__ == '__main__':
+    main()
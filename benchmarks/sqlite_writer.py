@@ -0,0 +1,86 @@
+"""Benchmark writing chat messages to a SQLite database.
+
+Inserts a synthetic stream of chat messages with `ContinuousWriter` (for a few
+batch sizes), then times some queries which use the indexes. Writing one
+transaction per message (batch size 1) is measured over fewer messages.
+
+Usage: python benchmarks/sqlite_writer.py [number of messages]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Allow direct execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
+
+from chat_downloader.output.continuous_write import ContinuousWriter
+
+
+def generate_messages(count):
+    # Texts and authors are generated up front, so that the benchmark
+    # measures the writer rather than the generation of messages
+    rng = random.Random(0)
+    words = ['hello', 'GG', 'lol', 'nice', 'pog', 'what', 'chat', ':)']
+    texts = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+             for _ in range(1000)]
+    authors = [{
+        'id': f'user{author}',
+        'name': f'User {author}',
+        'display_name': f'User {author}',
+        'badges': [{'name': 'subscriber', 'version': 1}]
+    } for author in range(5000)]
+
+    start = 1_600_000_000_000_000
+    for i in range(count):
+        yield {
+            'message_id': f'{i:08x}-0000-0000-0000-000000000000',
+            'message': texts[i % len(texts)],
+            'message_type': 'paid_message' if i % 20 == 0 else 'text_message',
+            'action_type': 'add_chat_item',
+            'timestamp': start + i * 100000,
+            'time_in_seconds': i / 10,
+            'author': authors[i % len(authors)],
+            'is_moderator': False
+        }
+
+
+def benchmark(path, count, batch_size):
+    start = time.perf_counter()
+    with ContinuousWriter(path, batch_size=batch_size) as writer:
+        for message in generate_messages(count):
+            writer.write(message)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'chat.db')
+
+        for batch_size, batch_count in ((1, min(count, 10000)), (1000, count), (10000, count)):
+            elapsed = benchmark(path, batch_count, batch_size)
+            print(f'batch size {batch_size:>5}: {batch_count:>9,} messages in {elapsed:6.2f} s '
+                  f'({batch_count / elapsed:,.0f} messages/s)')
+
+        print(f'database size: {os.path.getsize(path) / 2 ** 20:.1f} MiB')
+
+        connection = sqlite3.connect(path)
+        queries = (
+            ('messages by author', "SELECT COUNT(*) FROM messages WHERE author_id = 'user42'"),
+            ('messages in a minute', 'SELECT COUNT(*) FROM messages WHERE time_in_seconds BETWEEN 600 AND 660'),
+            ('paid messages', "SELECT COUNT(*) FROM messages WHERE message_type = 'paid_message'"),
+        )
+        for name, query in queries:
+            start = time.perf_counter()
+            result, = connection.execute(query).fetchone()
+            elapsed = time.perf_counter() - start
+            print(f'{name:>20}: {elapsed * 1e3:8.2f} ms ({result:,} rows)')
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
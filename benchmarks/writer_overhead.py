@@ -0,0 +1,77 @@
+"""Benchmark the per-item overhead of `ContinuousWriter.write`.
+
+Items are written to a writer class which discards them, so that only the
+work done by `ContinuousWriter` (flush policy, rotation checks, etc.) is
+measured. Calling the writer class directly is shown for comparison.
+
+Usage: python benchmarks/writer_overhead.py [number of items]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Allow direct execution
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
+
+from chat_downloader.output.continuous_write import (
+    CW,
+    ContinuousWriter,
+    SharedItem,
+    register_writer
+)
+
+
+@register_writer('null')
+class NullCW(CW):
+    __slots__ = ()
+
+    def write(self, item, flush=False):
+        pass
+
+    def write_shared(self, shared, flush=False):
+        pass
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def benchmark(write, items, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            write(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    items = [{'message': 'hello', 'message_id': str(i)} for i in range(count)]
+    shared_items = [SharedItem(item) for item in items]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'chat.null')
+
+        cases = (
+            ('writer class', NullCW(path).write, items),
+            ('default', ContinuousWriter(path).write, items),
+            ('flush policy', ContinuousWriter(
+                path, flush_every=100, flush_interval=1).write, items),
+            ('shared items', ContinuousWriter(path).write, shared_items),
+        )
+
+        for name, write, case_items in cases:
+            elapsed = benchmark(write, case_items)
+            print(f'{name:>14}: {elapsed / count * 1e9:7.0f} ns/item')
+
+
+if __name__ == '__main__':
+    main()
@@ -16,10 +16,12 @@ from .sites import get_all_sites
 from .formatting.format import ItemFormatter
 from .utils.core import (
     get_default_args,
-    update_dict_without_overwrite
+    update_dict_without_overwrite,
+    wrap_as_list
 )
 
 from .utils.timed_utils import TimedGenerator
+from .utils.dedupe import Deduplicator
 
 from .debugging import (
     log,
@@ -28,7 +30,10 @@ from .debugging import (
     TestingException
 )
 
-from .output.continuous_write import ContinuousWriter
+from .output.continuous_write import (
+    ContinuousWriter,
+    MultiWriter
+)
 
 
 from requests.exceptions import (
@@ -93,11 +98,24 @@ class ChatDownloader():
                  message_groups=SiteDefault('message_groups'),
                  message_types=None,
 
+                 # Deduplication
+                 dedupe=False,
+                 dedupe_window=600,
+                 dedupe_size=100000,
+
                  # Output
                  output=None,
                  overwrite=True,
                  sort_keys=True,
                  indent=4,
+                 flush_every=100,
+                 flush_interval=1,
+                 background_writer=False,
+                 compression_level=None,
+                 rotate_bytes=None,
+                 rotate_items=None,
+                 rotate_interval=None,
+                 on_segment_complete=None,
 
                  # Formatting
                  format=SiteDefault('format'),
@@ -109,7 +127,12 @@ class ChatDownloader():
 
                  # Twitch
                  message_receive_timeout=5,
-                 buffer_size=4096
+                 buffer_size=4096,
+                 max_concurrent_segments=4,
+                 badge_cache=None,
+
+                 # Soop
+                 flag_bitmask=False
                  ):
         """Used to get chat messages from a livestream, video, clip or past broadcast.
 
@@ -146,9 +169,21 @@ class ChatDownloader():
         :type message_groups: SiteDefault, optional
         :param message_types: List of messages types to include, defaults to None
         :type message_types: list, optional
+        :param dedupe: Skip messages which have already been received (e.g.
+            recent messages which are sent again after reconnecting). Messages
+            are identified by their id, or by their content if they have none.
+            Defaults to False
+        :type dedupe: bool, optional
+        :param dedupe_window: Minimum number of seconds for which received
+            messages are remembered, defaults to 600
+        :type dedupe_window: float, optional
+        :param dedupe_size: Maximum number of received messages to remember,
+            defaults to 100000
+        :type dedupe_size: int, optional
         :param output: Path of the output file, defaults to None (print to
-            standard output)
-        :type output: str, optional
+            standard output). If a list of paths is given, messages are
+            written to each of them.
+        :type output: Union[str, list], optional
         :param overwrite: If True, overwrite output file. Otherwise, append
             to the end of the file. Defaults to True. In both cases, the file
             (and directories) is created if it does not exist.
@@ -159,6 +194,36 @@ class ChatDownloader():
             nonnumerical input is provided, this will be used to indent
             the objects. Defaults to 4
         :type indent: Union[int, str], optional
+        :param flush_every: Flush the output file after this many messages
+            have been written, defaults to 100. Messages are also flushed
+            when no new messages have arrived.
+        :type flush_every: int, optional
+        :param flush_interval: Flush the output file if this many seconds
+            have passed since it was last flushed, defaults to 1
+        :type flush_interval: float, optional
+        :param background_writer: Write to the output file in a separate
+            thread, so that retrieving messages never waits for the disk.
+            Defaults to False
+        :type background_writer: bool, optional
+        :param compression_level: Compression level to use when the output
+            file is compressed (i.e. its name ends with .gz, .xz or .bz2, as
+            in chat.jsonl.gz), defaults to None (the default of the format)
+        :type compression_level: int, optional
+        :param rotate_bytes: Split the output into files of roughly this
+            many bytes, defaults to None (no limit). The output file name may
+            contain the {index} and {start} (e.g. {start:%Y-%m-%d_%H}) fields
+            of each file, otherwise the index is added before the extension.
+        :type rotate_bytes: int, optional
+        :param rotate_items: Split the output into files of this many
+            messages, defaults to None (no limit)
+        :type rotate_items: int, optional
+        :param rotate_interval: Start a new output file at every multiple of
+            this many seconds (e.g. 3600 for every hour), defaults to None
+            (no limit)
+        :type rotate_interval: float, optional
+        :param on_segment_complete: Function to call with the name of each
+            output file once it is complete, defaults to None
+        :type on_segment_complete: function, optional
         :param format: Specify how messages should be formatted for printing,
             defaults to the site's default value
         :type format: SiteDefault, optional
@@ -167,7 +232,8 @@ class ChatDownloader():
         :type format_file: str, optional
         :param chat_type: Specify chat type, defaults to 'live'
         :type chat_type: str, optional
-        :param ignore: Ignore a list of video ids, defaults to None
+        :param ignore: Ignore a list of video ids. Paths to files containing
+            one video id per line may also be given. Defaults to None
         :type ignore: list, optional
         :param message_receive_timeout: Time before requesting for new messages,
             defaults to 5
@@ -175,6 +241,18 @@ class ChatDownloader():
         :param buffer_size: Specify a buffer size for retrieving messages,
             defaults to 4096
         :type buffer_size: int, optional
+        :param max_concurrent_segments: Maximum number of segments of a past
+            broadcast to download at the same time. Set to 1 to download
+            comments sequentially. Defaults to 4
+        :type max_concurrent_segments: int, optional
+        :param badge_cache: Path of a file in which to store the badges of
+            channels, so that they are not fetched again in later runs.
+            Defaults to None
+        :type badge_cache: str, optional
+        :param flag_bitmask: Output the flags of Soop users as an integer
+            bitmask (the second flag word in the upper 32 bits), instead of
+            a comma-separated list of names. Defaults to False
+        :type flag_bitmask: bool, optional
         :raises URLNotProvided: if no URL is provided
         :raises ChatGeneratorError: if no valid generator can be found for a site
         :raises SiteNotSupported: if no matching site can be found
@@ -229,6 +307,10 @@ class ChatDownloader():
                     raise ChatGeneratorError(
                         f'No valid generator found in {site.__name__} for url "{url}"')
 
+                if params['dedupe']:
+                    chat.chat = Deduplicator(
+                        params['dedupe_window'], params['dedupe_size']).filter(chat.chat)
+
                 if isinstance(params['max_messages'], int):
                     chat.chat = itertools.islice(
                         chat.chat, params['max_messages'])
@@ -261,13 +343,24 @@ class ChatDownloader():
                     x, format_name=params['format'])
 
                 if params['output']:
-                    chat.attach_writer(ContinuousWriter(
-                        params['output'],
+                    writers = [ContinuousWriter(
+                        output,
                         indent=params['indent'],
                         sort_keys=params['sort_keys'],
                         overwrite=params['overwrite'],
+                        flush_every=params['flush_every'],
+                        flush_interval=params['flush_interval'],
+                        background=params['background_writer'],
+                        compression_level=params['compression_level'],
+                        rotate_bytes=params['rotate_bytes'],
+                        rotate_items=params['rotate_items'],
+                        rotate_interval=params['rotate_interval'],
+                        on_segment_complete=params['on_segment_complete'],
                         lazy_initialise=True
-                    ))
+                    ) for output in wrap_as_list(params['output'])]
+
+                    chat.attach_writer(
+                        writers[0] if len(writers) == 1 else MultiWriter(writers))
 
                 chat.site = site_object
 
@@ -61,7 +61,8 @@ def main(cli_args=None):
 
         for param in docstring.params:
             info[param.arg_name] = {
-                'help': param.description,
+                # argparse formats help strings with %
+                'help': param.description.replace('%', '%%'),
                 'default': args.get(param.arg_name)
             }
         return info
@@ -95,6 +96,12 @@ def main(cli_args=None):
     add_chat_param(type_options, '--message_types', type=splitter)
     add_chat_param(type_options, '--message_groups', type=splitter)
 
+    dedupe_group = parser.add_argument_group('Deduplication Arguments')
+    add_chat_param(dedupe_group, '--dedupe',
+                   type=str2bool, nargs='?', const=True)
+    add_chat_param(dedupe_group, '--dedupe_window', type=float)
+    add_chat_param(dedupe_group, '--dedupe_size', type=int)
+
     retry_group = parser.add_argument_group(
         'Retry Arguments')  # what to do when an error occurs
     add_chat_param(retry_group, '--max_attempts', type=int)
@@ -136,14 +143,29 @@ def main(cli_args=None):
     add_chat_param(
         twitch_group, '--message_receive_timeout', type=float)
     add_chat_param(twitch_group, '--buffer_size', type=int)
+    add_chat_param(twitch_group, '--max_concurrent_segments', type=int)
+    add_chat_param(twitch_group, '--badge_cache')
+
+    soop_group = parser.add_argument_group(
+        '[Site Specific] Soop Arguments')
+    add_chat_param(soop_group, '--flag_bitmask',
+                   type=str2bool, nargs='?', const=True)
 
     output_group = parser.add_argument_group('Output Arguments')
-    add_chat_param(output_group, '--output', '-o')
+    add_chat_param(output_group, '--output', '-o', action='append')
     add_chat_param(output_group, '--overwrite',
                    type=str2bool, nargs='?', const=True)
     add_chat_param(output_group, '--sort_keys',
                    type=str2bool, nargs='?', const=True)
     add_chat_param(output_group, '--indent', type=lambda x: int_or_none(x, x))
+    add_chat_param(output_group, '--flush_every', type=int)
+    add_chat_param(output_group, '--flush_interval', type=float)
+    add_chat_param(output_group, '--background_writer',
+                   type=str2bool, nargs='?', const=True)
+    add_chat_param(output_group, '--compression_level', type=int)
+    add_chat_param(output_group, '--rotate_bytes', type=int)
+    add_chat_param(output_group, '--rotate_items', type=int)
+    add_chat_param(output_group, '--rotate_interval', type=float)
 
     # Debugging only available from the CLI
     debug_group = parser.add_argument_group('Debugging/Testing Arguments')
@@ -1,9 +1,114 @@
 import os
-import json
 import csv
-import shutil
+import bz2
+import gzip
+import lzma
+import time
+import sqlite3
+import queue
+import threading
+import string
+from datetime import datetime, timezone
 
-from ..utils.core import flatten_json
+from ..utils.core import flatten_json, partial_format
+from ..debugging import log
+from ..utils.json_codec import (
+    json_loads,
+    json_dumps,
+    json_dumpb,
+    JSONDecodeError
+)
+
+
+# Compression formats, mapped to the function used to open such files and
+# the name of the argument which sets the compression level
+_COMPRESSORS = {
+    'gz': (gzip.open, 'compresslevel'),
+    'xz': (lzma.open, 'preset'),
+    'bz2': (bz2.open, 'compresslevel')
+}
+
+
+class SharedItem:
+    """
+    A chat item which is written to one or more writers. The forms in which
+    writers store items (JSON, flattened or formatted text) are computed at
+    most once, and shared between the writers.
+    """
+
+    __slots__ = ('item', 'formatter', '_json', '_flat', '_text')
+
+    def __init__(self, item, formatter=None):
+        """Create a SharedItem object.
+
+        :param item: The chat item
+        :type item: dict
+        :param formatter: Function used to format the item as text, defaults
+            to None (use `str`)
+        :type formatter: function, optional
+        """
+        self.item = item
+        self.formatter = formatter
+        self._json = {}
+        self._flat = None
+        self._text = None
+
+    def json(self, sort_keys=False, indent=None):
+        """Get the item encoded as UTF-8 JSON bytes.
+
+        :param sort_keys: Whether to sort the keys of dictionaries, defaults to False
+        :type sort_keys: bool, optional
+        :param indent: Number of spaces (or the string) to indent by, defaults
+            to None (compact output)
+        :type indent: Union[int, str], optional
+        :return: The encoded item
+        :rtype: bytes
+        """
+        key = (sort_keys, indent)
+        data = self._json.get(key)
+        if data is None:
+            data = self._json[key] = json_dumpb(
+                self.item, sort_keys=sort_keys, indent=indent)
+        return data
+
+    def flat(self):
+        """Get the flattened item (see `flatten_json`).
+
+        :return: The flattened item, which must not be modified
+        :rtype: dict
+        """
+        if self._flat is None:
+            self._flat = flatten_json(self.item)
+        return self._flat
+
+    def text(self):
+        """Get the item formatted as text.
+
+        :return: The formatted item
+        :rtype: str
+        """
+        if self._text is None:
+            self._text = str(self.item) if self.formatter is None else self.formatter(self.item)
+        return self._text
+
+
+_WRITERS = {}  # File extension -> writer class
+
+
+def register_writer(*extensions):
+    """Class decorator which registers a writer class, to be used by
+    `ContinuousWriter` for files with the given extensions.
+
+    :param extensions: The file extensions (without the leading dot)
+    :type extensions: str
+    :return: The decorator
+    :rtype: function
+    """
+    def decorator(writer_class):
+        for extension in extensions:
+            _WRITERS[extension] = writer_class
+        return writer_class
+    return decorator
 
 
 class CW:
@@ -11,17 +116,61 @@ class CW:
     Base class for continuous file writers.
     """
 
-    def __init__(self, file_name, overwrite=True, **kwargs):
+    __slots__ = ('file_name', 'overwrite', 'compression', 'compression_level', 'file')
+
+    # Whether the output may be written through a compressed stream
+    supports_compression = True
+
+    def __init__(self, file_name, overwrite=True, compression=None, compression_level=None, **kwargs):
         """Create a CW object.
 
         :param file_name: The name of the file to write to
         :type file_name: str
         :param overwrite: Whether to overwrite if the file already exists, defaults to True
         :type overwrite: bool, optional
+        :param compression: Compress the file with this format ('gz', 'xz'
+            or 'bz2'), defaults to None (no compression)
+        :type compression: str, optional
+        :param compression_level: The compression level, defaults to None
+            (the default of the compression format)
+        :type compression_level: int, optional
+        :raises ValueError: if the compression format is not supported
         """
         self.file_name = file_name
         self.overwrite = overwrite
 
+        if compression is not None and (
+                compression not in _COMPRESSORS or not self.supports_compression):
+            raise ValueError(
+                f'Compression format "{compression}" is not supported by {self.__class__.__name__}')
+
+        self.compression = compression
+        self.compression_level = compression_level
+
+    def _open(self, file_name, mode, **kwargs):
+        """Open a file, through a compressed stream if the writer is compressed.
+        When appending to a compressed file, a new stream (e.g. gzip member)
+        is added to its end.
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :param mode: The mode in which to open the file
+        :type mode: str
+        :return: The file object
+        :rtype: io.IOBase
+        """
+        if self.compression is None:
+            return open(file_name, mode, **kwargs)
+
+        opener, level_argument = _COMPRESSORS[self.compression]
+        if 'r' not in mode and self.compression_level is not None:
+            kwargs[level_argument] = self.compression_level
+
+        if 'b' not in mode and 't' not in mode:
+            mode += 't'  # Compressed files are opened in binary mode by default
+
+        return opener(file_name, mode, **kwargs)
+
     def close(self):
         self.file.close()
 
@@ -38,15 +187,58 @@ class CW:
         """
         raise NotImplementedError
 
+    def write_shared(self, shared, flush=False):
+        """Write a chat item which is shared with other writers. Subclasses
+        should use the forms of the item which have already been computed.
+
+        :param shared: The chat item
+        :type shared: SharedItem
+        :param flush: Whether to force the file to be flushed after writing,
+            defaults to False
+        :type flush: bool, optional
+        """
+        self.write(shared.item, flush)
+
     def flush(self):
         self.file.flush()
 
+    def sync(self):
+        """Flush the file and make sure that its contents are written to disk."""
+        self.flush()
+        os.fsync(self.file.fileno())
+
+    def size(self):
+        """Get the number of bytes written to disk so far (used to decide
+        when to rotate the output).
 
+        :return: The number of bytes
+        :rtype: int
+        """
+        return os.path.getsize(self.file_name)
+
+
+@register_writer('json')
 class JSONCW(CW):
     """
     Class used to control the continuous writing of a list of dictionaries to a JSON file.
+
+    Items are appended to the file with a single (buffered) write each. The
+    closing bracket of the array is only written when the file is flushed or
+    closed, so the file is valid JSON after every flush. When appending to an
+    existing file, only its end is read (to find the closing bracket).
     """
 
+    __slots__ = ('indent', 'separator', 'indent_character', 'sort_keys', '_started', '_has_items')
+
+    _TAIL_BLOCK_SIZE = 4096
+
+    # Limits on the search for the last item of an array which was not closed
+    _MAX_ITEM_SIZE = 1 << 20
+    _MAX_ITEM_CANDIDATES = 16
+
+    # Items are inserted before the closing bracket, which requires seeking
+    supports_compression = False
+
     def __init__(self, file_name, indent=None, separator=', ', indent_character=' ', sort_keys=True, **kwargs):
         super().__init__(file_name, **kwargs)
 
@@ -55,145 +247,663 @@ class JSONCW(CW):
         self.indent_character = indent_character
         self.sort_keys = sort_keys
 
-        # open file for appending and reading in binary mode.
+        # open file for writing and reading in binary mode.
         self.file = open(self.file_name, 'rb+')
 
-        previous_items = []  # save previous
+        self._started = False  # Whether the array has been opened
+        self._has_items = False
+
         if not self.overwrite:  # may have other data
             try:
-                previous_items = json.load(self.file)
-            except json.decoder.JSONDecodeError:
-                # TODO create .tmp, file shutil.copy(), self.file.read()
+                position = self._find_items_end()
+            except Exception:
+                self.file.close()
+                raise
+
+            if position is not None:
+                self._started = True
+                self.file.seek(position)
+                return
+
+        self.file.seek(0)
+        self.file.truncate()  # empty file
+
+    def _find_items_end(self):
+        """Find where the items of the JSON array in the file end, reading
+        only the end of the file. If the array was not closed (e.g. because
+        the program stopped before flushing), items are appended after the
+        last complete item.
+
+        :raises ValueError: if the file has data, but does not end with a
+            JSON array or a complete item
+        :return: The position after the last item (or after the opening
+            bracket, if the array is empty). None if the file has no data.
+        :rtype: int
+        """
+        end = self.file.seek(0, os.SEEK_END)
+        last = self._find_last_character(end)
+        if last is None:  # Empty (or whitespace)
+            return None
+
+        position, character = last
+        if character == b']':
+            previous = self._find_last_character(position)
+            if previous is not None:
+                position, character = previous
+                self._has_items = character != b'['
+                return position + 1
+
+        elif character == b'}' and self._ends_with_item(position + 1):
+            self._has_items = True
+            return position + 1
+
+        raise ValueError(
+            f'Unable to append to "{self.file_name}", as it does not end with a JSON array')
+
+    def _find_last_character(self, end):
+        # Find the last non-whitespace character before `end`
+        while end > 0:
+            start = max(end - self._TAIL_BLOCK_SIZE, 0)
+            self.file.seek(start)
+            block = self.file.read(end - start)
+
+            stripped = block.rstrip()
+            if stripped:
+                index = len(stripped) - 1
+                return start + index, stripped[index:index + 1]
+
+            end = start
+
+        return None
+
+    def _ends_with_item(self, end):
+        # Check whether a complete item ends at `end`. Items start after the
+        # opening bracket or a separator, followed by the item's indentation.
+        start = max(end - self._MAX_ITEM_SIZE, 0)
+        self.file.seek(start)
+        tail = self.file.read(end - start)
+
+        lead = b'' if self.indent is None else b'\n' + self._padding().encode()
+        candidates = []
+        for prefix in (self.separator.encode() + lead, b'[' + lead):
+            index = tail.rfind(prefix)
+            while index != -1 and len(candidates) < self._MAX_ITEM_CANDIDATES:
+                candidates.append(index + len(prefix))
+                index = tail.rfind(prefix, 0, index)
+
+        # The last item starts at the latest candidate which can be parsed
+        for candidate in sorted(candidates, reverse=True)[:self._MAX_ITEM_CANDIDATES]:
+            try:
+                if isinstance(json_loads(tail[candidate:]), dict):
+                    return True
+            except JSONDecodeError:
                 pass
 
-        self.file.truncate(0)  # empty file
+        return False
 
-        # rewrite with new formatting
-        for previous_item in previous_items:
-            self.write(previous_item)
+    def _padding(self):
+        return self.indent * self.indent_character if isinstance(
+            self.indent, int) else self.indent
 
     def _multiline_indent(self, text):
-        padding = self.indent * \
-            self.indent_character if isinstance(
-                self.indent, int) else self.indent
+        padding = self._padding()
         return ''.join(map(lambda x: padding + x, text.splitlines(True)))
 
     def write(self, item, flush=False):
+        self._write_json(json_dumps(
+            item, indent=self.indent, sort_keys=self.sort_keys), flush)
 
-        self.file.seek(0, os.SEEK_END)  # Go to the end of file
+    def write_shared(self, shared, flush=False):
+        self._write_json(shared.json(
+            self.sort_keys, self.indent).decode('utf-8'), flush)
 
-        to_write = json.dumps(
-            item, ensure_ascii=False, indent=self.indent, sort_keys=self.sort_keys)
+    def _write_json(self, to_write, flush):
         if self.indent is not None:
-            indent_padding = '\n'  # to add on a new line
-            to_write = indent_padding + self._multiline_indent(to_write)
-        else:
-            indent_padding = ''
+            to_write = '\n' + self._multiline_indent(to_write)
 
-        if self.file.tell() == 0:  # Check if file is empty
-            # If empty, write the start of an array
-            self.file.write('['.encode())
-        else:
-            # seek to last character
-            self.file.seek(-len(indent_padding) - 1, os.SEEK_END)
-            self.file.write(self.separator.encode())  # Write the separator
+        if self._has_items:
+            to_write = self.separator + to_write
+        elif not self._started:  # Write the start of an array
+            to_write = '[' + to_write
+            self._started = True
 
-        self.file.write(to_write.encode())  # Dump the item
-        self.file.write((indent_padding + ']').encode())  # Close the array
+        self.file.write(to_write.encode())
+        self._has_items = True
 
         if flush:
             self.flush()
 
+    def _write_end(self):
+        # Close the array, then return to where the next item will be written
+        if not self._started:
+            return
+
+        position = self.file.tell()
+        indent_padding = '\n' if self.indent is not None and self._has_items else ''
+        self.file.write((indent_padding + ']').encode())
+        self.file.truncate()  # Remove anything after the array
+        self.file.seek(position)
+
+    def flush(self):
+        self._write_end()
+        super().flush()
+
+    def close(self):
+        self._write_end()
+        super().close()
 
+
+@register_writer('csv')
 class CSVCW(CW):
     """
     Class used to control the continuous writing of a list of dictionaries to a CSV file.
+
+    If the columns are declared up front, rows are appended to the file as
+    they are written (keys which are not one of the columns are ignored).
+    Otherwise, rows are appended to a spool file (the output file name,
+    followed by `.spool`) and the CSV file is written once, with every column
+    seen, when the writer is closed. In both cases, memory usage only depends
+    on the number of columns.
     """
 
-    def __init__(self, file_name, sort_keys=True, **kwargs):
+    __slots__ = ('sort_keys', 'existing_columns', 'spool_name', 'columns', 'csv_dict_writer', '_known_columns')
+
+    def __init__(self, file_name, sort_keys=True, columns=None, **kwargs):
+        """Create a CSVCW object.
+
+        :param file_name: The name of the file to write to
+        :type file_name: str
+        :param sort_keys: Whether to sort the columns, defaults to True.
+            Declared columns are never sorted.
+        :type sort_keys: bool, optional
+        :param columns: The columns of the file, defaults to None (use the
+            keys of the items which are written)
+        :type columns: list, optional
+        """
         super().__init__(file_name, **kwargs)
         self.sort_keys = sort_keys
-        self.file = open(self.file_name, 'a+', newline='', encoding='utf-8')
-
-        if not self.overwrite:
-            # save previous data
-            self.file.seek(0)  # go to beginning of file
-            csv_dict_reader = csv.DictReader(self.file)
-            self.columns = list(csv_dict_reader.fieldnames or [])
-            self.all_items = [dict(x) for x in csv_dict_reader]
-        else:
-            self.columns = []
-            self.all_items = []
 
-        self._reset_dict_writer()
+        self.existing_columns = []
+        if not self.overwrite:  # may have other data
+            with self._open(self.file_name, 'r', newline='', encoding='utf-8') as f:
+                self.existing_columns = next(csv.reader(f), [])
+
+        if columns is not None:
+            self.spool_name = None
+            self.columns = self.existing_columns or list(columns)
+
+            self.file = self._open(
+                self.file_name, 'a', newline='', encoding='utf-8')
+            self.csv_dict_writer = csv.DictWriter(
+                self.file, fieldnames=self.columns, extrasaction='ignore')
 
-    def _reset_dict_writer(self):
-        self.csv_dict_writer = csv.DictWriter(
-            self.file, fieldnames=self.columns)
+            if not self.existing_columns:
+                self.csv_dict_writer.writeheader()
+
+        else:
+            self.spool_name = f'{self.file_name}.spool'
+            self.columns = list(self.existing_columns)
+            self._known_columns = set(self.columns)
+
+            self.file = open(self.spool_name, 'wb')
 
     def write(self, item, flush=False, flatten=True):
         if flatten:
             item = flatten_json(item)
-        self.all_items.append(item)
-
-        new_columns = [column for column in item.keys()
-                       if column not in self.columns]
-        if new_columns:  # new column(s) found, must rewrite whole file
-            self.columns += new_columns
-            if self.sort_keys:
-                self.columns.sort()
-
-            self.file.truncate(0)  # empty file
 
-            self._reset_dict_writer()  # update writer with new columns
-            self.csv_dict_writer.writeheader()  # write new header
-            self.csv_dict_writer.writerows(self.all_items)  # write previous
+        if self.spool_name is None:
+            self.csv_dict_writer.writerow(item)
         else:
-            self.csv_dict_writer.writerow(item)  # write newest item
+            for column in item:
+                if column not in self._known_columns:
+                    self._known_columns.add(column)
+                    self.columns.append(column)
+
+            self.file.write(json_dumpb(item) + b'\n')
 
         if flush:
             self.flush()
 
+    def write_shared(self, shared, flush=False):
+        self.write(shared.flat(), flush, flatten=False)
+
+    def size(self):
+        if self.spool_name is None:
+            return super().size()
+        # Until the writer is closed, rows are held in the spool file
+        return super().size() + os.path.getsize(self.spool_name)
+
+    def _spooled_items(self):
+        with open(self.spool_name, 'rb') as spool:
+            for line in spool:
+                yield json_loads(line)
+
+    def close(self):
+        super().close()
+
+        if self.spool_name is None:
+            return
+
+        if self.existing_columns and len(self.columns) == len(self.existing_columns):
+            # No new columns, so the rows can be added to the existing file
+            with self._open(self.file_name, 'a', newline='', encoding='utf-8') as f:
+                csv_dict_writer = csv.DictWriter(f, fieldnames=self.existing_columns)
+                csv_dict_writer.writerows(self._spooled_items())
+
+        else:  # Write the file (along with any previous rows) with the new header
+            columns = sorted(self.columns) if self.sort_keys else self.columns
+            temp_name = f'{self.file_name}.tmp'
+
+            with self._open(temp_name, 'w', newline='', encoding='utf-8') as f:
+                csv_dict_writer = csv.DictWriter(f, fieldnames=columns)
+                csv_dict_writer.writeheader()
+
+                if self.existing_columns:
+                    with self._open(self.file_name, 'r', newline='', encoding='utf-8') as previous:
+                        csv_dict_writer.writerows(csv.DictReader(previous))
+
+                csv_dict_writer.writerows(self._spooled_items())
+
+            os.replace(temp_name, self.file_name)
+
+        os.remove(self.spool_name)
+        self.spool_name = None  # Only finalise once
+
 
+@register_writer('jsonl')
 class JSONLCW(CW):
     """
     Class used to control the continuous writing of a JSON lines.
     """
 
+    __slots__ = ('sort_keys',)
+
     def __init__(self, file_name, sort_keys=True, **kwargs):
         super().__init__(file_name, **kwargs)
         self.sort_keys = sort_keys
-        self.file = open(self.file_name, 'a', encoding='utf-8')
+        self.file = self._open(self.file_name, 'ab')
+
+    def write(self, item, flush=False):
+        self.file.write(json_dumpb(item, sort_keys=self.sort_keys) + b'\n')
+
+        if flush:
+            self.flush()
+
+    def write_shared(self, shared, flush=False):
+        self.file.write(shared.json(self.sort_keys) + b'\n')
+
+        if flush:
+            self.flush()
+
+
+def _import_pyarrow():
+    # pyarrow is an optional dependency, which is only imported when needed
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            'pyarrow is required to write Parquet files. Install it with: pip install chat-downloader[parquet]') from e
+    return pyarrow, pyarrow.parquet
+
+
+@register_writer('parquet')
+class ParquetCW(CW):
+    """
+    Class used to control the continuous writing of a list of dictionaries to a Parquet file.
+
+    Items are flattened (see `flatten_json`) and buffered until a row group is
+    full, after which the row group is written. Each column's type is inferred
+    from its values. Integer and float columns are stored as floats, and
+    columns holding other mixed types are stored as strings.
+
+    When new columns (or types) appear, the rows written so far keep their
+    schema and following row groups are written to another part file (the
+    output file name, followed by `.<number>.part`). When the writer is
+    closed, the parts (and the existing file, when appending) are combined
+    row group by row group into the output file, using the final schema.
+    """
+
+    __slots__ = ('pyarrow', 'parquet', 'row_group_size', 'rows', 'schema', 'parts', 'part_writer')
+
+    supports_compression = False  # Parquet files are compressed internally
+
+    def __init__(self, file_name, row_group_size=10000, **kwargs):
+        """Create a ParquetCW object.
+
+        :param file_name: The name of the file to write to
+        :type file_name: str
+        :param row_group_size: Number of rows in each row group, defaults to 10000
+        :type row_group_size: int, optional
+        :raises ImportError: if pyarrow is not installed
+        """
+        super().__init__(file_name, **kwargs)
+        self.pyarrow, self.parquet = _import_pyarrow()
+
+        self.row_group_size = row_group_size
+        self.rows = []
+
+        self.schema = None
+        self.parts = []
+        self.part_writer = None
+
+        if not self.overwrite and os.path.getsize(self.file_name) > 0:
+            self.parts.append(self.file_name)
+            self.schema = self.parquet.read_schema(self.file_name)
+
+    def _build_column(self, values):
+        pyarrow = self.pyarrow
+        try:
+            return pyarrow.array(values)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, OverflowError):
+            return pyarrow.array(
+                [None if value is None else str(value) for value in values], pyarrow.string())
+
+    def _merge_types(self, old, new):
+        types = self.pyarrow.types
+        if old == new or types.is_null(new):
+            return old
+        if types.is_null(old):
+            return new
+        if all(types.is_integer(t) or types.is_floating(t) for t in (old, new)):
+            return self.pyarrow.float64()
+        return self.pyarrow.string()
+
+    def _conform(self, table, schema):
+        # Add missing columns and cast the others to the types of the schema
+        columns = []
+        for field in schema:
+            if field.name in table.column_names:
+                columns.append(table.column(field.name).cast(field.type))
+            else:
+                columns.append(self.pyarrow.nulls(len(table), field.type))
+        return self.pyarrow.Table.from_arrays(columns, schema=schema)
+
+    def _write_row_group(self):
+        if not self.rows:
+            return
+
+        names = {}  # Column names, in the order they were seen
+        for row in self.rows:
+            names.update(dict.fromkeys(row))
+
+        table = self.pyarrow.Table.from_arrays(
+            [self._build_column([row.get(name) for row in self.rows]) for name in names],
+            names=list(names))
+        self.rows = []
+
+        schema = self.schema
+        if schema is None:
+            schema = table.schema
+        else:
+            fields = {field.name: field.type for field in schema}
+            for field in table.schema:
+                fields[field.name] = self._merge_types(
+                    fields.get(field.name, field.type), field.type)
+            schema = self.pyarrow.schema(list(fields.items()))
+
+        if self.part_writer is None or not schema.equals(self.schema):
+            if self.part_writer is not None:
+                self.part_writer.close()
+
+            part_name = f'{self.file_name}.{len(self.parts)}.part'
+            self.part_writer = self.parquet.ParquetWriter(part_name, schema)
+            self.parts.append(part_name)
+            self.schema = schema
+
+        self.part_writer.write_table(
+            self._conform(table, schema), row_group_size=len(table))
+
+    def write(self, item, flush=False, flatten=True):
+        if flatten:
+            item = flatten_json(item)
+
+        self.rows.append(item)
+        if len(self.rows) >= self.row_group_size:
+            self._write_row_group()
+
+    def write_shared(self, shared, flush=False):
+        self.write(shared.flat(), flush, flatten=False)
+
+    def flush(self):
+        pass  # Parquet files can only be read once closed
+
+    def size(self):
+        # Until the writer is closed, rows are written to the part files
+        return sum(os.path.getsize(part) for part in self.parts)
+
+    def sync(self):
+        pass  # The output file is written (and replaced atomically) when closed
+
+    def close(self):
+        if self.schema is None and not self.rows:
+            # Nothing was written, so do not leave an empty (invalid) file
+            if os.path.exists(self.file_name) and os.path.getsize(self.file_name) == 0:
+                os.remove(self.file_name)
+            return
+
+        self._write_row_group()
+        if self.part_writer is not None:
+            self.part_writer.close()
+            self.part_writer = None
+
+        if self.parts == [f'{self.file_name}.0.part']:
+            os.replace(self.parts[0], self.file_name)
+
+        elif self.parts[-1] != self.file_name:  # Combine the parts
+            temp_name = f'{self.file_name}.tmp'
+            with self.parquet.ParquetWriter(temp_name, self.schema) as writer:
+                for part in self.parts:
+                    part_file = self.parquet.ParquetFile(part)
+                    for index in range(part_file.num_row_groups):
+                        writer.write_table(self._conform(
+                            part_file.read_row_group(index), self.schema))
+                    part_file.close()
+
+            os.replace(temp_name, self.file_name)
+            for part in self.parts:
+                if part != self.file_name:
+                    os.remove(part)
+
+        self.parts = [self.file_name]  # Only finalise once
+
+
+@register_writer('sqlite', 'db')
+class SQLiteCW(CW):
+    """
+    Class used to control the continuous writing of a list of dictionaries to a SQLite database.
+
+    Messages are stored in the `messages` table, which references the
+    `authors` table (holding the latest information about each author).
+    Fields without a column of their own are stored as JSON in the `data`
+    columns. Items are inserted in batches, each in a single transaction, and
+    messages whose `message_id` is already in the database are skipped, so
+    that a download can be resumed by appending to the same database.
+    """
+
+    __slots__ = ('batch_size', 'sort_keys', 'connection', 'authors', 'messages')
+
+    supports_compression = False
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS authors (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            display_name TEXT,
+            data TEXT
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            message_id TEXT UNIQUE,
+            message_type TEXT,
+            action_type TEXT,
+            timestamp INTEGER,
+            time_in_seconds REAL,
+            time_text TEXT,
+            author_id TEXT REFERENCES authors(id),
+            message TEXT,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS messages_timestamp ON messages(timestamp);
+        CREATE INDEX IF NOT EXISTS messages_time_in_seconds ON messages(time_in_seconds);
+        CREATE INDEX IF NOT EXISTS messages_author_id ON messages(author_id);
+        CREATE INDEX IF NOT EXISTS messages_message_type ON messages(message_type);
+    """
+
+    # Fields of an item which have a column in the messages table
+    _MESSAGE_FIELDS = ('message_id', 'message_type', 'action_type', 'timestamp',
+                       'time_in_seconds', 'time_text')
+
+    _INSERT_AUTHOR = 'INSERT OR REPLACE INTO authors VALUES (?, ?, ?, ?)'
+    _INSERT_MESSAGE = """INSERT OR IGNORE INTO messages (
+        message_id, message_type, action_type, timestamp, time_in_seconds,
+        time_text, author_id, message, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    def __init__(self, file_name, batch_size=1000, sort_keys=True, **kwargs):
+        """Create a SQLiteCW object.
+
+        :param file_name: The name of the file to write to
+        :type file_name: str
+        :param batch_size: Number of items to insert in each transaction,
+            defaults to 1000
+        :type batch_size: int, optional
+        :param sort_keys: Whether to sort the keys of the JSON data, defaults to True
+        :type sort_keys: bool, optional
+        """
+        super().__init__(file_name, **kwargs)
+        self.batch_size = batch_size
+        self.sort_keys = sort_keys
+
+        if self.overwrite:  # Remove the log of a previous database
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self.file_name + suffix):
+                    os.remove(self.file_name + suffix)
+
+        # Items may be written by the background thread of a ContinuousWriter
+        self.connection = sqlite3.connect(
+            self.file_name, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self._SCHEMA)
+
+        self.authors = {}
+        self.messages = []
 
     def write(self, item, flush=False):
-        print(json.dumps(item, ensure_ascii=False, sort_keys=self.sort_keys),
-              file=self.file, flush=flush)
+        item = dict(item)
+        author = item.pop('author', None)
+
+        author_id = None
+        if isinstance(author, dict) and author.get('id') is not None:
+            author_id = str(author['id'])
+            self.authors[author_id] = (
+                author_id, author.get('name'), author.get('display_name'),
+                json_dumps(author, sort_keys=self.sort_keys))
+
+        message_id = item.pop('message_id', None)
+        self.messages.append((
+            None if message_id is None else str(message_id),
+            *(item.pop(field, None) for field in self._MESSAGE_FIELDS[1:]),
+            author_id,
+            item.pop('message', None),
+            json_dumps(item, sort_keys=self.sort_keys) if item else None
+        ))
+
+        if flush or len(self.messages) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.messages:
+            return
+
+        with self.connection:  # Insert the batch in a single transaction
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                self._INSERT_AUTHOR, self.authors.values())
+            self.connection.executemany(self._INSERT_MESSAGE, self.messages)
+
+        self.authors = {}
+        self.messages = []
 
+    def sync(self):
+        self.flush()
 
+    def size(self):
+        # Committed transactions may still be in the write-ahead log
+        wal_name = self.file_name + '-wal'
+        wal_size = os.path.getsize(wal_name) if os.path.exists(wal_name) else 0
+        return super().size() + wal_size
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+@register_writer('txt')
 class TXTCW(CW):
     """
     Class used to control the continuous writing of a text to a TXT file.
     """
 
+    __slots__ = ()
+
     def __init__(self, file_name, **kwargs):
         super().__init__(file_name, **kwargs)
-        self.file = open(self.file_name, 'a', encoding='utf-8')
+        self.file = self._open(self.file_name, 'a', encoding='utf-8')
 
     def write(self, item, flush=False):
         print(item, file=self.file, flush=flush)
 
+    def write_shared(self, shared, flush=False):
+        self.write(shared.text(), flush)
+
+
+def _split_extension(file_name):
+    # Split off the extension, including any compression suffix (e.g. .jsonl.gz)
+    root, extension = os.path.splitext(file_name)
+    if extension[1:].lower() in _COMPRESSORS:
+        root, inner_extension = os.path.splitext(root)
+        extension = inner_extension + extension
+    return root, extension
+
+
+_FLUSH = object()  # Queued to request a flush from the background thread
+_STOP = object()  # Queued to stop the background thread
+
 
 class ContinuousWriter:
-    _SUPPORTED_WRITERS = {
-        'json': JSONCW,
-        'csv': CSVCW,
-        'jsonl': JSONLCW,
-        'txt': TXTCW
-    }
-
-    def __init__(self, file_name=None, overwrite=True, format=None, lazy_initialise=False, **kwargs):
+    __slots__ = (
+        'file_name', 'overwrite', 'format', 'lazy_initialise', 'flush_every',
+        'flush_interval', 'background', 'queue_size', 'rotate_bytes',
+        'rotate_items', 'rotate_interval', 'on_segment_complete', 'writer_kwargs',
+        'writer', 'segment_name', '_pending', '_last_flush', '_queue', '_thread',
+        '_error', '_writer_class', '_segment_index', '_segment_names',
+        '_segment_items', '_segment_end', '_closed', '_initialised'
+    )
+
+    # Writer classes, by file extension (see `register_writer`)
+    _SUPPORTED_WRITERS = _WRITERS
+
+    def __init__(self, file_name=None, overwrite=True, format=None, lazy_initialise=False,
+                 flush_every=None, flush_interval=None, background=False, queue_size=1024,
+                 rotate_bytes=None, rotate_items=None, rotate_interval=None,
+                 on_segment_complete=None, **kwargs):
         """Create a ContinuousWriter object.
 
+        Unless a flush is requested when writing an item, items are flushed
+        according to the flush policy (`flush_every` and `flush_interval`),
+        when the writer is idle (see `idle`) and when it is closed.
+
+        If a rotation rule is set, the output is split into segments. The file
+        name may contain the `{index}` (number of the segment, starting at 0)
+        and `{start}` (start time of the segment, as a datetime in UTC, e.g.
+        `{start:%Y-%m-%d_%H}`) fields. The file name is only formatted if it
+        contains one of these fields, in which case other braces must be
+        doubled (e.g. `{{` for `{`). If a segment would have the same name as
+        an earlier segment, its index is added before the extension. While
+        being written, a segment's name is followed by `.part`, and the file is
+        renamed once the segment is complete.
+
         :param file_name: The name of the file to write to
         :type file_name: str
         :param overwrite: Whether to overwrite if the file already exists, defaults to True
@@ -202,35 +912,105 @@ class ContinuousWriter:
         :type format: str, optional
         :param lazy_initialise: Skip file creation on initialisation, defaults to False.
         :type lazy_initialise: bool, optional
+        :param flush_every: Flush after this many items have been written,
+            defaults to None (no limit)
+        :type flush_every: int, optional
+        :param flush_interval: Flush if this many seconds have passed since
+            the last flush, defaults to None (no limit)
+        :type flush_interval: float, optional
+        :param background: Write items in a background thread, so that
+            `write` does not wait for the disk. Defaults to False
+        :type background: bool, optional
+        :param queue_size: Maximum number of items waiting to be written by
+            the background thread, after which `write` blocks. Defaults to 1024
+        :type queue_size: int, optional
+        :param rotate_bytes: Start a new segment once the file reaches this
+            size (checked when flushing), defaults to None (no limit)
+        :type rotate_bytes: int, optional
+        :param rotate_items: Start a new segment after this many items,
+            defaults to None (no limit)
+        :type rotate_items: int, optional
+        :param rotate_interval: Start a new segment at every multiple of this
+            many seconds since the epoch (e.g. 3600 for every hour), defaults
+            to None (no limit)
+        :type rotate_interval: float, optional
+        :param on_segment_complete: Function to call with the file name of
+            each completed segment (including the last one, when the writer
+            is closed), e.g. to compress or upload it. Defaults to None
+        :type on_segment_complete: function, optional
+        :raises ValueError: if appending (`overwrite` is False) to an existing
+            JSON file which does not end with a JSON array (or a complete item
+            of one). The file is left unchanged. If `lazy_initialise` is True,
+            this is raised by the first write instead.
+
+        Other keyword arguments (e.g. `indent` or `sort_keys`) are passed on
+        to the writer class.
         """
-        super().__setattr__('data', dict())
         self.file_name = file_name
         self.overwrite = overwrite
         self.format = format
         self.lazy_initialise = lazy_initialise
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.background = background
+        self.queue_size = queue_size
+        self.rotate_bytes = rotate_bytes
+        self.rotate_items = rotate_items
+        self.rotate_interval = rotate_interval
+        self.on_segment_complete = on_segment_complete
         self.writer = None
-        self.data.update(kwargs)
+        self.segment_name = None  # File name of the current segment
+        self.writer_kwargs = kwargs
+
+        self._pending = 0  # Number of items written since the last flush
+        self._last_flush = time.monotonic()
+        self._queue = None
+        self._thread = None
+        self._error = None  # Raised by the background thread
+
+        self._writer_class = None
+        self._segment_index = 0
+        self._segment_names = set()
+        self._segment_items = 0
+        self._segment_end = None  # Time at which the segment ends
+        self._closed = False
 
         self._initialised = False
         if not self.lazy_initialise:
             self._real_init()
 
     def __getattr__(self, name):
-        if name in self.data:
-            return self.data[name]
+        # Only called if the attribute is not found, e.g. for writer arguments
+        if name != 'writer_kwargs' and name in self.writer_kwargs:
+            return self.writer_kwargs[name]
 
         raise AttributeError(
             f"'ContinuousWriter' object has no attribute '{name}'")
 
-    def __setattr__(self, key, value):
-        self.data[key] = value
-
     def is_default(self):
-        return isinstance(self.writer, TXTCW)
+        return self._writer_class is TXTCW
 
     def is_initialised(self):
         return self._initialised
 
+    def has_rotation_fields(self):
+        """Check whether the file name contains the `{index}` or `{start}`
+        fields, and is therefore formatted for each segment.
+
+        :return: True if the file name contains a rotation field
+        :rtype: bool
+        """
+        try:
+            return any(field.partition('.')[0].partition('[')[0] in ('index', 'start')
+                       for _, field, _, _ in string.Formatter().parse(self.file_name or '')
+                       if field is not None)
+        except ValueError:  # Unmatched braces
+            return False
+
+    def _rotates(self):
+        return any(rule is not None for rule in (
+            self.rotate_bytes, self.rotate_items, self.rotate_interval))
+
     def _real_init(self):
         if self._initialised:
             return
@@ -240,31 +1020,317 @@ class ContinuousWriter:
         if self.file_name is None:
             raise AttributeError('File name not set')
 
-        if not os.path.exists(self.file_name) or self.overwrite:
-            directory = os.path.dirname(self.file_name)
+        extension = self.format
+        if extension is None:
+            extension = _split_extension(self.file_name)[1].lower()
+            extension, _, compression = extension[1:].partition('.')
+
+            if compression:  # e.g. chat.jsonl.gz
+                self.writer_kwargs.setdefault('compression', compression)
+
+        self._writer_class = self._SUPPORTED_WRITERS.get(extension, TXTCW)
+
+        self._open_segment()
+
+        if self.background:
+            self._queue = queue.Queue(self.queue_size)
+            self._thread = threading.Thread(
+                target=self._run, name='ContinuousWriter', daemon=True)
+            self._thread.start()
+
+    def _open_segment(self):
+        now = time.time()
+        if self.rotate_interval is not None:
+            start = now // self.rotate_interval * self.rotate_interval
+            self._segment_end = start + self.rotate_interval
+        else:
+            start = now
+
+        segment_name = self.file_name
+        if self.has_rotation_fields():
+            # Boundaries are multiples of the interval since the epoch, so the
+            # start time is given in UTC to match them
+            segment_name = partial_format(
+                segment_name, index=self._segment_index,
+                start=datetime.fromtimestamp(start, timezone.utc))
+
+        if segment_name in self._segment_names:  # Do not replace an earlier segment
+            root, extension = _split_extension(segment_name)
+            segment_name = f'{root}.{self._segment_index}{extension}'
+
+        self._segment_names.add(segment_name)
+        self.segment_name = segment_name
+        self._segment_items = 0
+
+        file_name = segment_name
+        if self._rotates():
+            file_name += '.part'
+            if not self.overwrite and os.path.exists(segment_name):
+                os.replace(segment_name, file_name)  # Continue the segment
+
+        if not os.path.exists(file_name) or self.overwrite:
+            directory = os.path.dirname(file_name)
             if directory:  # (non-empty directory - i.e. not in current folder)
                 # must make parent directory
                 os.makedirs(directory, exist_ok=True)
-            open(self.file_name, 'w').close()  # create an empty file
+            open(file_name, 'w').close()  # create an empty file
+
+        self.writer = self._writer_class(
+            file_name, overwrite=self.overwrite, **self.writer_kwargs)
+
+    def _close_segment(self):
+        try:
+            self.writer.sync()
+        finally:
+            self.writer.close()
+            self.writer = None
+            self._pending = 0
+
+        if self._rotates():
+            part_name = self.segment_name + '.part'
+            self._segment_index += 1
+            if not os.path.exists(part_name):
+                return  # Removed by the writer, as nothing was written
+            os.replace(part_name, self.segment_name)
 
-        extension = self.format or os.path.splitext(self.file_name)[
-            1][1:].lower()
-        writer_class = ContinuousWriter._SUPPORTED_WRITERS.get(
-            extension, TXTCW)
-        self.writer = writer_class(**self.data)
+        if self.on_segment_complete is not None:
+            try:
+                self.on_segment_complete(self.segment_name)
+            except Exception as e:
+                log('error', f'Unable to complete segment "{self.segment_name}": {e}')
+
+    def _segment_ended(self):
+        return self._segment_end is not None and time.time() >= self._segment_end
+
+    def _flush(self):
+        if self.writer is None:
+            return
+
+        self.writer.flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+        if self.rotate_bytes is not None and \
+                self.writer.size() >= self.rotate_bytes:
+            self._close_segment()
+
+    def _flush_due(self):
+        if self.flush_every is not None and self._pending >= self.flush_every:
+            return True
+
+        return self.flush_interval is not None and \
+            time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _write(self, item, flush):
+        writer = self.writer
+        if writer is None or (self._segment_end is not None and time.time() >= self._segment_end):
+            if writer is not None:  # The segment has ended
+                self._close_segment()
+            self._open_segment()
+            writer = self.writer
+
+        if isinstance(item, SharedItem):
+            writer.write_shared(item)
+        else:
+            writer.write(item)
+
+        self._pending += 1
+        self._segment_items += 1
+
+        if flush or self._flush_due():
+            self._flush()
+
+        if self.rotate_items is not None and self.writer is not None and \
+                self._segment_items >= self.rotate_items:
+            self._close_segment()
+
+    def _idle(self):
+        if self.writer is None:
+            return
+
+        if self._segment_ended():
+            self._close_segment()
+        elif self._pending:
+            self._flush()
+
+    def _time_until_segment_end(self):
+        if self.writer is None or self._segment_end is None:
+            return None
+        return max(self._segment_end - time.time(), 0)
+
+    def _run(self):
+        # Write the queued items, flushing whenever the queue runs empty
+        while True:
+            try:
+                entry = self._queue.get(timeout=self._time_until_segment_end())
+            except queue.Empty:
+                entry = None
+
+            try:
+                if entry is _STOP:
+                    return
+                elif entry is _FLUSH:
+                    self._flush()
+                elif entry is not None:
+                    self._write(*entry)
+
+                if self._queue.empty():
+                    self._idle()
+
+            except Exception as e:
+                self._error = e
+                return
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _put(self, entry):
+        # Do not wait forever if the background thread has stopped
+        while True:
+            self._check_error()
+            try:
+                self._queue.put(entry, timeout=1)
+                return
+            except queue.Full:
+                pass
 
     def write(self, item, flush=False):
+        """Write a chat item.
+
+        :param item: The chat item
+        :type item: Union[dict, SharedItem]
+        :param flush: Whether to force the file to be flushed after writing,
+            defaults to False
+        :type flush: bool, optional
+        :raises ValueError: if the writer has been closed
+        """
+        if self._closed:
+            raise ValueError('Cannot write to a closed writer')
+
         if not self._initialised:  # create file when first item is written
             self._real_init()
 
-        self.writer.write(item, flush)
+        if self._queue is not None:
+            self._put((item, flush))
+        else:
+            self._write(item, flush)
+
+    def flush(self):
+        """Flush the items which have been written so far."""
+        if not self._initialised:
+            return
+
+        if self._queue is not None:
+            self._put(_FLUSH)
+        else:
+            self._flush()
+
+    def idle(self):
+        """Notify the writer that no items are expected for a while, so
+        that it can flush the items it is holding on to (and complete the
+        current segment, if it has ended)."""
+        if self._initialised and self._queue is None:
+            self._idle()
 
     def __enter__(self):
         return self
 
     def close(self):
-        if self._initialised:
-            self.writer.close()
+        """Write all remaining items, save them to disk and close the file.
+        Closing the writer more than once has no effect."""
+        if not self._initialised or self._closed:
+            return
+
+        self._closed = True
+        try:
+            if self._thread is not None:
+                self._put(_STOP)
+                self._thread.join()
+                self._thread = self._queue = None
+                self._check_error()
+        finally:
+            if self.writer is not None:
+                self._close_segment()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MultiWriter:
+    """
+    Class used to write the same items to several writers (e.g. to store the
+    formatted messages, a JSON lines archive and a database at the same time).
+
+    Each item is serialised (or flattened, or formatted) at most once per
+    form, and shared between the writers. If a writer raises an error, the
+    error is logged and the writer is no longer used, while the other writers
+    carry on.
+    """
+
+    __slots__ = ('writers', 'active_writers', '_initialised')
+
+    def __init__(self, writers):
+        """Create a MultiWriter object.
+
+        :param writers: The writers
+        :type writers: list of ContinuousWriter
+        """
+        self.writers = list(writers)
+        self.active_writers = list(self.writers)
+        self._initialised = False
+
+    def is_initialised(self):
+        return self._initialised
+
+    def _call(self, method, *args):
+        for writer in list(self.active_writers):
+            try:
+                getattr(writer, method)(*args)
+            except Exception as e:
+                log('error', f'Stopped writing to "{writer.file_name}": {e}')
+                self.active_writers.remove(writer)
+                self._close(writer)
+
+    @staticmethod
+    def _close(writer):
+        try:
+            writer.close()
+        except Exception as e:
+            log('error', f'Unable to close "{writer.file_name}": {e}')
+
+    def _real_init(self):
+        if not self._initialised:
+            self._initialised = True
+            self._call('_real_init')
+
+    def write(self, item, flush=False):
+        """Write a chat item to every writer.
+
+        :param item: The chat item
+        :type item: Union[dict, SharedItem]
+        :param flush: Whether to force the files to be flushed after writing,
+            defaults to False
+        :type flush: bool, optional
+        """
+        if not isinstance(item, SharedItem):
+            item = SharedItem(item)
+        self._call('write', item, flush)
+
+    def flush(self):
+        self._call('flush')
+
+    def idle(self):
+        self._call('idle')
+
+    def __enter__(self):
+        return self
+
+    def close(self):
+        for writer in self.active_writers:
+            self._close(writer)
+        self.active_writers = []
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
@@ -160,6 +160,8 @@ RETURN_CODE = {
     "PASSWORD_ERROR": 57,  # 왜 아프리카 클라 const에 없는거지?
 }
 
+RETURN_CODE_NAMES = {value: name for name, value in RETURN_CODE.items()}
+
 
 FLAG = {
     "MOBILE_WEB": {
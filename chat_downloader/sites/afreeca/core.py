@@ -1,29 +1,57 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from typing import Callable, Coroutine, Optional, cast
 
 import orjson
 from aiohttp import ClientSession, ClientWebSocketResponse, WSMessage, WSMsgType
 
-from .constants import CHAT_URL, FLAG, RETURN_CODE, ServiceCode
-from .credential import Credential
+from .constants import CHAT_URL, FLAG, RETURN_CODE, RETURN_CODE_NAMES, ServiceCode
+from .credential import Credential, get_shared_session
 from .exceptions import NotStreamingError, PasswordError
 from .interfaces import BJInfo, BroadcastInfo, Chat
-from .packet import create_packet
+from .packet import create_packet, decode_packet
 from .types.bj_info import BJInfo as BJInfoDict
-from .utils import Flag, callback
+from .utils import Flag, callback, get_callbacks
 
 Callback = Coroutine[None, None, None]
 
 
 class AfreecaTV:
+    # Seconds for which the information about a broadcast is reused
+    BJ_INFO_TTL = 60
+
+    _bj_info_cache: dict[tuple[str, Credential], tuple[float, BJInfo]] = {}
+
     def __init__(self, credential: Credential) -> None:
         self.credential = credential
 
     async def get_bj_info(self, bj_id: str) -> BJInfo:
         return await self.fetch_bj_info(self.credential, bj_id)
 
+    @classmethod
+    async def fetch_cached_bj_info(cls, credential: Credential, bj_id: str) -> BJInfo:
+        """Same as fetch_bj_info, but reuses information fetched less than
+        BJ_INFO_TTL seconds ago. Older information is fetched again, so that
+        (re)connections use up-to-date chat servers and tokens."""
+        key = (bj_id, credential)
+        now = time.monotonic()
+
+        cached = cls._bj_info_cache.get(key)
+        if cached is not None and now - cached[0] < cls.BJ_INFO_TTL:
+            return cached[1]
+
+        info = await cls.fetch_bj_info(credential, bj_id)
+
+        # Drop expired entries
+        for old_key, (fetched, _) in list(cls._bj_info_cache.items()):
+            if now - fetched >= cls.BJ_INFO_TTL:
+                del cls._bj_info_cache[old_key]
+
+        cls._bj_info_cache[key] = (now, info)
+        return info
+
     async def get_broadcast_info(self, bj_id: str) -> BroadcastInfo | None:
         return await self.fetch_broadcast_info(self.credential, bj_id)
 
@@ -111,6 +139,8 @@ class AfreecaChat:
         self.connection: Optional[ClientWebSocketResponse] = None
 
         self.callbacks: dict[str, list[Callable[[Chat], Callback]]] = {}
+        self.batch_callbacks: dict[str, list[Callable[[list], None]]] = {}
+        self._pending: dict[str, list] = {}
         self.process_callbacks: dict[
             int, list[Callable[[AfreecaChat, list[str]], None]]
         ] = {}
@@ -130,6 +160,41 @@ class AfreecaChat:
             if callback in callbacks:
                 self.callbacks[event].remove(callback)
 
+    def add_batch_callback(self, event: str, callback: Callable[[list], None]) -> None:
+        """Register a (regular) function which is called with lists of events.
+
+        Events received during the same pass of the event loop, e.g. the chats
+        of every frame which was already buffered, are delivered in one call.
+        "chat" callbacks receive lists of Chat objects and "all" callbacks
+        receive lists of (svc, packet) tuples.
+        """
+        if self.batch_callbacks.get(event) is None:
+            self.batch_callbacks[event] = []
+
+        self.batch_callbacks[event].append(callback)
+
+    def remove_batch_callback(self, callback: Callable[[list], None]) -> None:
+        for event, callbacks in self.batch_callbacks.items():
+            if callback in callbacks:
+                self.batch_callbacks[event].remove(callback)
+
+    def _emit_batched(self, event: str, item) -> None:
+        if not self.batch_callbacks.get(event):
+            return
+
+        pending = self._pending.get(event)
+        if pending is None:
+            pending = self._pending[event] = []
+            asyncio.get_running_loop().call_soon(self._flush, event)
+
+        pending.append(item)
+
+    def _flush(self, event: str) -> None:
+        items = self._pending.pop(event, [])
+
+        for callback in self.batch_callbacks.get(event, []):
+            callback(items)
+
     def set_password(self, password: str) -> None:
         self.room_password = password
 
@@ -155,10 +220,12 @@ class AfreecaChat:
         await self.loop()
 
     async def connect(self, sub: bool = False) -> None:
-        if not self.info:
-            self.info = await AfreecaTV.fetch_bj_info(self.credential, self.bj_id)
+        self.info = await AfreecaTV.fetch_cached_bj_info(self.credential, self.bj_id)
+
+        if self.connection is not None and not self.connection.closed:
+            await self.connection.close()
 
-        self.session = ClientSession()
+        self.session = await get_shared_session()
         self.connection = await self.session.ws_connect(self.info.chat_url)
 
         await self.send(
@@ -190,18 +257,13 @@ class AfreecaChat:
         if msg.type != WSMsgType.BINARY:
             return
 
-        header = msg.data[:14]
-        body = msg.data[14:]
-
-        svc = int(header[2:6])
-        ret_code = int(header[12:14])
+        svc, ret_code, packet = decode_packet(msg.data)
 
         if ret_code == RETURN_CODE["PASSWORD_ERROR"]:
             raise PasswordError()
 
         if ret_code > RETURN_CODE["SUCCESS"]:
-            reversed_ret_code = {v: k for k, v in RETURN_CODE.items()}
-            print(f"not success ret_code: {reversed_ret_code[ret_code]}")
+            print(f"not success ret_code: {RETURN_CODE_NAMES.get(ret_code, ret_code)}")
 
             return
 
@@ -219,26 +281,11 @@ class AfreecaChat:
 
             await self.send(ServiceCode.SVC_JOINCH, content)
 
-        packet: list[str] = []
+        handler = self._handlers.get(svc)
+        if handler is not None:
+            await handler(self, packet)
 
-        try:
-            packet = body.decode("utf-8").strip().split("\f")
-        except UnicodeDecodeError:
-            packet_raw: list[bytes] = body.split()
-
-            for packet_part in packet_raw:
-                try:
-                    packet.append(packet_part.decode("utf-8"))
-                except UnicodeDecodeError:
-                    packet.append(packet_part.decode("euc-kr"))
-
-        for name in self.__dir__():
-            if name.startswith("_process_"):
-                func = getattr(self, name)
-
-                if callable(func) and hasattr(func, "svc"):
-                    if func.svc == svc:
-                        await func(packet)
+        self._emit_batched("all", (svc, packet))
 
         for callback in self.callbacks.get("all", []):
             asyncio.create_task(callback(svc, packet))
@@ -250,5 +297,14 @@ class AfreecaChat:
 
         chat = Chat(packet)
 
+        self._emit_batched("chat", chat)
+
         for callback in self.callbacks.get("chat", []):
             asyncio.create_task(callback(chat))
+
+    # svc -> handler, built once from the methods decorated with @callback
+    _handlers = get_callbacks(locals())
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._handlers = {**cls._handlers, **get_callbacks(vars(cls))}
@@ -1,11 +1,39 @@
 from __future__ import annotations
 
+import asyncio
+import time
+import weakref
 from typing import Optional
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, DummyCookieJar
 
 from .exceptions import LoginError
 
+_sessions: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, ClientSession
+] = weakref.WeakKeyDictionary()
+
+
+async def get_shared_session() -> ClientSession:
+    """Get the session (and connection pool) shared by everything running in
+    the current event loop. Per-credential headers are passed per request,
+    so the session does not store cookies."""
+    loop = asyncio.get_running_loop()
+
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = ClientSession(cookie_jar=DummyCookieJar())
+
+    return session
+
+
+async def close_shared_session() -> None:
+    """Close the session shared by everything running in the current event
+    loop, e.g. before the loop is closed."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
 
 class Credential:
     headers: dict[str, str] = {
@@ -14,21 +42,24 @@ class Credential:
     }
     pdbox_ticket: Optional[str] = None
     au: Optional[str] = None
-    _session: Optional[ClientSession] = None
-
-    async def get_session(self) -> ClientSession:
-        if self._session is None:
-            self._session = ClientSession()
 
-        self._session.headers.update(self.headers)
+    def __init__(self) -> None:
+        # Each credential has its own cookies
+        self.headers = dict(Credential.headers)
 
-        return self._session
+    async def get_session(self) -> ClientSession:
+        return await get_shared_session()
 
 
 class GuestCredential(Credential): ...
 
 
 class UserCredential(Credential):
+    # Logins are reused for an hour
+    CACHE_TTL = 3600
+
+    _cache: dict[tuple[str, str], tuple[float, asyncio.Task[UserCredential]]] = {}
+
     @classmethod
     async def login(cls, id: str, pw: str) -> UserCredential:
         credential = cls()
@@ -37,6 +68,7 @@ class UserCredential(Credential):
         response = await session.post(
             "https://login.sooplive.co.kr/app/LoginAction.php",
             data=f"szUid={id}&szPassword={pw}&szWork=login",
+            headers=credential.headers,
         )
 
         cookies = {key: value.value for key, value in response.cookies.items()}
@@ -52,11 +84,40 @@ class UserCredential(Credential):
 
         return credential
 
+    @classmethod
+    def _is_reusable(cls, cached: tuple[float, asyncio.Task[UserCredential]]) -> bool:
+        created, task = cached
+
+        if time.monotonic() - created >= cls.CACHE_TTL:
+            return False
+        if task.get_loop() is not asyncio.get_running_loop():
+            return False
+
+        # Failed logins are retried
+        return not task.done() or (not task.cancelled() and task.exception() is None)
+
+    @classmethod
+    async def get(cls, id: str, pw: str) -> UserCredential:
+        """Log in, or reuse an earlier login of the same account which has not
+        expired. Concurrent calls for the same account share one login."""
+        key = (id, pw)
+
+        cached = cls._cache.get(key)
+        if cached is None or not cls._is_reusable(cached):
+            cached = (time.monotonic(), asyncio.create_task(cls.login(id, pw)))
+            cls._cache[key] = cached
+
+        return await asyncio.shield(cached[1])
+
     async def logout(self) -> None:
         session = await self.get_session()
 
-        await session.get("https://login.sooplive.co.kr/app/LogOut.php")
-
-        await session.close()
+        await session.get(
+            "https://login.sooplive.co.kr/app/LogOut.php", headers=self.headers
+        )
 
-        self._session = None
+        # Do not reuse this login any more
+        for key, (_, task) in list(self._cache.items()):
+            if task.done() and not task.cancelled() and task.exception() is None:
+                if task.result() is self:
+                    del self._cache[key]
@@ -4,7 +4,7 @@ from dataclasses import dataclass
 from typing import Optional
 
 from .types.packet import ChatPacket
-from .utils import get_color, get_flags
+from .utils import get_color, get_flag_mask, get_flags
 
 
 @dataclass
@@ -41,7 +41,8 @@ class Chat:
 
     chat_lang: int
     subscription_month: Optional[int]
-    flags: list[str]
+    flags: tuple[str, ...]
+    flag_mask: int
 
     def __init__(self, packet: list[str]) -> None:
         data = self._parse_packet(packet)["data"]
@@ -52,6 +53,7 @@ class Chat:
         self.chat_lang = data["chatLang"]
         self.subscription_month = data["subscription_month"]
         self.flags = data["flags"]
+        self.flag_mask = data["flagMask"]
 
     def _parse_packet(self, packet: list[str]) -> ChatPacket:
         message = packet[0].replace("\r", "")
@@ -85,6 +87,7 @@ class Chat:
                     "color": color,
                     "subscription_month": subscription_month,
                     "flags": get_flags(flag1, flag2),
+                    "flagMask": get_flag_mask(flag1, flag2),
                 },
             }
 
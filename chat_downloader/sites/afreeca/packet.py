@@ -21,3 +21,42 @@ def create_packet(svc: int, data: list[str]) -> bytes:
     header = _make_bytes(_make_header(svc, len(body)))
 
     return header + body
+
+
+HEADER_SIZE = 14
+_FIELD_SEPARATOR = 0x0C  # \f
+
+
+def _decode_field(field: bytes) -> str:
+    try:
+        return field.decode("utf-8")
+    except UnicodeDecodeError:
+        return field.decode("euc-kr", "replace")
+
+
+def decode_packet(data: bytes) -> tuple[int, int, list[str]]:
+    """Decode a packet into its service code, return code and body fields.
+
+    Fields are separated (and the body is terminated) by \f. The body is
+    normally decoded as UTF-8 in one go. If that fails, it is split at byte
+    level and each field is decoded on its own, as UTF-8 or, failing that,
+    EUC-KR, so one badly encoded field does not affect the others.
+    """
+    end = len(data)
+    if end < HEADER_SIZE:
+        raise ValueError(f"packet too short: {end} bytes")
+
+    svc = int(data[2:6])
+    ret_code = int(data[12:14])
+
+    start = HEADER_SIZE
+    if start < end and data[start] == _FIELD_SEPARATOR:
+        start += 1
+    if end > start and data[end - 1] == _FIELD_SEPARATOR:
+        end -= 1
+
+    body = data[start:end]
+    try:
+        return svc, ret_code, body.decode("utf-8").split("\f")
+    except UnicodeDecodeError:
+        return svc, ret_code, [_decode_field(field) for field in body.split(b"\f")]
@@ -16,6 +16,7 @@ class ChatPacketData(TypedDict):
     permission: NotRequired[int]
     chatLang: NotRequired[int]
     nickname: NotRequired[str]
-    flags: NotRequired[list[str]]
+    flags: NotRequired[tuple[str, ...]]
+    flagMask: NotRequired[int]
     subscription_month: NotRequired[Optional[int]]
     color: NotRequired[Optional[str]]
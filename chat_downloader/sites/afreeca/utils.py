@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from .constants import FLAG
 
@@ -13,17 +14,22 @@ def get_color(raw_color: Optional[str]) -> Optional[str]:
     return f"#{c[4:6]}{c[2:4]}{c[0:2]}"
 
 
-def get_flags(flag1: str, flag2: str) -> list[str]:
-    flags = []
+# (word, bit, name) of every flag, in the order of FLAG
+_FLAG_BITS = tuple((data["where"], data["value"], flag) for flag, data in FLAG.items())
 
-    for flag, data in FLAG.items():
-        where, value = data["where"], data["value"]
-        flag_binary = int(flag1) if where == 1 else int(flag2)
 
-        if flag_binary & value:
-            flags.append(flag)
+@lru_cache(maxsize=1024)
+def get_flags(flag1: str, flag2: str) -> tuple[str, ...]:
+    # Viewers of a room share a few combinations of flags, so the
+    # (immutable) result is cached for each combination
+    words = (0, int(flag1), int(flag2))
 
-    return flags
+    return tuple(flag for where, value, flag in _FLAG_BITS if words[where] & value)
+
+
+def get_flag_mask(flag1: str, flag2: str) -> int:
+    """Combine both flag words into one integer, with flag2 in the upper 32 bits."""
+    return int(flag1) | int(flag2) << 32
 
 
 class Flag:
@@ -67,3 +73,11 @@ def callback(svc: int):
         return func
 
     return decorator
+
+
+def get_callbacks(namespace: dict[str, Any]) -> dict[int, Callable]:
+    return {
+        func.svc: func
+        for func in namespace.values()
+        if callable(func) and hasattr(func, "svc")
+    }
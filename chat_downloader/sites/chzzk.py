@@ -1,15 +1,15 @@
-import queue
-from json.decoder import JSONDecodeError
-from threading import Thread
-from typing import Optional
+import asyncio
+import time
 
-import orjson
+from aiohttp import ClientError, WSMsgType
 from requests.exceptions import RequestException
-from websocket import WebSocketApp
 
 from ..debugging import log
 from ..errors import SiteError, UnexpectedError, UserNotFound, VideoUnavailable
+from ..utils.async_runtime import get_runtime
 from ..utils.core import attempts
+from ..utils.json_codec import JSONDecodeError, json_dumpb, json_dumps, json_loads
+from .afreeca.credential import close_shared_session, get_shared_session
 from .common import BaseChatDownloader, Chat
 
 # NOTE: https://github.com/kimcore/chzzk/blob/main/src/chat/chat.ts
@@ -91,48 +91,47 @@ class ChzzkChatDownloader(BaseChatDownloader):
     _DEFAULT_NID_AUT = "nVrU5HBws13iBYAnAa5D7bnZrUtp69cn6T+V7BHQIXhHrBexYt9yDBjPS2+YvWdb"
     _DEFAULT_NID_SES = "AAABoWkzOGZj+RIiu6C4Jakp+RdUsaMtRgLbMzO8kh5it7a34ADYVPTvZKtrw9hPNd88WgRjMbyB8+dYw00N+jJckHHo6Q9szDa7Gssw1B7jJF0KiwAi6REeaJa3sdQomN/mdrWEHqvlizYg8cKWaIgCc+evNveEoxcd8zwuRPlSorGWcg09gMPmGwhdFN+eT37sWkCY+gU3W0bbOMUsghZQ/ULUif5+Ghv2fq1gfEukHkbbdiEyRqKuhjjiFn1JNj2cb6Mc+cYBOsZOPFqJ5YuYUVYPKLxg5/jVaH++EmUWgEKonVIlL2f0mjEoIoXYEhwMT4b+iu/xo41IWA35am2RkTLu7rVwSIebVTGLL2W5DAapfUje02SZ+jyl6ynEuhHlHf5994/8IJFerfE2Nh9AhWbECzCRpSTDYaolysKQ/uvUtXxmcuUWCtrUAPZQuXWwE0jtpBUzqZjDFuTMG16EetA0b1K3RrlD2BXut1LlTyfXEyy6UgeoijDnR18X6WvamMT3LieM6Q+QOFI3lhrmYnqUEP+UoYpArIHDtAesgQuKwiai6q1ooIsvtVuAIp6Xdw=="
 
-    queue = queue.Queue()
-    terminated = False
-    chat_channel_id = None
-    live_channel_id = None
     cookies = None
-    websocket: Optional[WebSocketApp]
-    websocket_thread: Optional[Thread] = None
-    timeout = 5
     max_retries = 5
-    proxy_host = None
-    proxy_port = None
+    ping_interval = 20
 
-    def on_message(self, ws, message):
+    # Maximum number of seconds to wait before reconnecting
+    max_reconnect_delay = 60
+
+    _CHAT_SERVER_URL = 'wss://kr-ss{server_id}.chat.naver.com/chat'
+
+    def _handle_message(self, message, chat_channel_id):
+        """Handle a message received from the chat server.
+
+        :return: The reply to send (if any) and the parsed chat messages
+        :rtype: tuple
+        """
         if not message:
-            return
+            return None, []
 
         try:
-            raw_msg = orjson.loads(message)
+            raw_msg = json_loads(message)
             cmd = raw_msg.get('cmd')
             if cmd == ChatCommands.CONNECTED:
-                log('info', f'Connected to {self.chat_channel_id}...')
-                self.sid = raw_msg['bdy']['sid']
-                self.send_json({
+                log('info', f'Connected to {chat_channel_id}...')
+                return {
                     "ver": "3",
                     "svcid": "game",
-                    "cid": self.chat_channel_id,
+                    "cid": chat_channel_id,
                     "cmd": ChatCommands.REQUEST_RECENT_CHAT,
                     "tid": 2,
-                    "sid": self.sid,
+                    "sid": raw_msg['bdy']['sid'],
                     "bdy": {
                         'recentMessageCount': 50
                     }
-                })
-                return
+                }, []
             elif cmd == ChatCommands.PING:
-                self.send_json({'ver': '3', 'cmd': ChatCommands.PONG})
-                return
+                return {'ver': '3', 'cmd': ChatCommands.PONG}, []
             elif cmd == ChatCommands.PONG:
-                return
+                return None, []
 
             if 'bdy' not in raw_msg:
-                return
+                return None, []
 
             raw_body = raw_msg['bdy']
             if isinstance(raw_body, list):
@@ -141,34 +140,18 @@ class ChzzkChatDownloader(BaseChatDownloader):
                 chat_msgs = raw_body.get('messageList', [raw_body])
             else:
                 log('error', f'Unknown format: {raw_body}')
-                return
+                return None, []
 
-            for chat_msg in chat_msgs:
-                data = self._parse_chat(chat_msg)
-                self.queue.put(data)
+            return None, [self._parse_chat(chat_msg) for chat_msg in chat_msgs]
         except Exception as e:
             log('error', f'Parsing message failed({e}): {message}')
+            return None, []
 
-    def on_error(self, ws, error):
-        # maybe this can be change of cid, retrieve info once more to confirm
-        log('error', f'Websocket Error: {error}')
-
-    def on_close(self, ws, close_status_code, close_msg):
-        # probably only when server requested to close
-        log('info', '### Websocket closed ###')
-        if not self.terminated:
-            # not closed by request, try again
-            is_live, _, _ = self.connect_websocket()
-            if not is_live:
-                # do not retry if not live
-                self.terminate()
-
-    def on_open(self, ws):
-        log('info', 'Opened connection')
-        self.send_json({
+    def _connect_message(self, chat_channel_id, access_token):
+        return {
             "ver": "3",
             "svcid": "game",
-            "cid": self.chat_channel_id,
+            "cid": chat_channel_id,
             "cmd": ChatCommands.CONNECT,
             "tid": 1,
             "bdy": {
@@ -179,13 +162,10 @@ class ChzzkChatDownloader(BaseChatDownloader):
                 "libVer": "4.9.3",
                 "locale": "ko",
                 "osVer": "Windows/10",
-                "accTkn": self.access_token,
+                "accTkn": access_token,
                 "auth": "READ"
             }
-        })
-
-    def send_json(self, data):
-        self.websocket.send(orjson.dumps(data))
+        }
 
     def _parse_chat(self, chat):
         message_time = chat.get('messageTime') or chat.get('msgTime')
@@ -212,7 +192,7 @@ class ChzzkChatDownloader(BaseChatDownloader):
             display_name = ''
             subscription = None
         else:
-            profile = orjson.loads(raw_profile)
+            profile = json_loads(raw_profile)
             if type(profile) is not dict:
                 display_name = ''
                 subscription = None
@@ -220,7 +200,7 @@ class ChzzkChatDownloader(BaseChatDownloader):
                 display_name = profile.get('nickname', '')
                 subscription = profile.get('streamingProperty', {}).get('subscription', None)
 
-        extras = orjson.loads(chat.get('extras', '{}'))
+        extras = json_loads(chat.get('extras', '{}'))
         emotes = extras.get('emojis')
         pay_amount = extras.get('payAmount')
 
@@ -310,109 +290,127 @@ class ChzzkChatDownloader(BaseChatDownloader):
                     self.retry(attempt_number, error=e, **params)
         return
 
-    def connect_websocket(self):
-        if self.websocket_thread and self.websocket_thread.is_alive():
-            self.websocket.close()
-
-        is_live, live_id, live_title, self.chat_channel_id = self.get_channel_detail()
-        if is_live:
-            self.server_id = sum([ord(c) for c in self.chat_channel_id]) % 9 + 1
-            self.access_token = self.get_chat_access_token()
-            self.websocket = WebSocketApp(
-                url=f'wss://kr-ss{self.server_id}.chat.naver.com/chat',
-                on_open=self.on_open,
-                on_message=self.on_message,
-                on_error=self.on_error,
-                on_close=self.on_close,
-                on_reconnect=self.on_open,
-            )
-            self.websocket_thread = Thread(
-                target=self.websocket.run_forever,
-                kwargs=dict(
-                    ping_interval=20,
-                    ping_payload=orjson.dumps({'ver': '3', 'cmd': ChatCommands.PING}),
-                    # http_proxy_host=self.proxy_host,
-                    # http_proxy_port=self.proxy_port
-                )
-            )
-            self.websocket_thread.start()
-        return is_live, live_id, live_title
+    async def _keepalive(self, ws):
+        ping_payload = json_dumpb({'ver': '3', 'cmd': ChatCommands.PING})
+        while not ws.closed:
+            await asyncio.sleep(self.ping_interval)
+            await ws.ping(ping_payload)
 
-    def _get_chat_messages_by_channel_id(self):
+    async def _get_chat_messages_by_channel_id(self, live_channel_id, chat_channel_id, cookies):
+        # Runs in the shared event loop, alongside all other live connections
+        loop = asyncio.get_running_loop()
+        session = await get_shared_session()  # Shared by all connections
         message_count = 0
-        try:
-            while True:
-                try:
-                    data = self.queue.get(timeout=self.timeout)
-                except queue.Empty:
-                    yield {}
-                    continue
+        failures = 0
+
+        while True:
+            # Blocking requests are made outside of the event loop
+            access_token = await loop.run_in_executor(
+                None, self.get_chat_access_token, chat_channel_id, cookies)
+
+            server_id = sum([ord(c) for c in chat_channel_id]) % 9 + 1
 
-                message_count += 1
-                yield data
-                log('debug', f'Total number of messages: {message_count}')
-        finally:
-            self.terminate()
+            try:
+                async with session.ws_connect(self._CHAT_SERVER_URL.format(server_id=server_id)) as ws:
+                    log('info', 'Opened connection')
+                    await ws.send_str(json_dumps(
+                        self._connect_message(chat_channel_id, access_token)))
+
+                    keepalive_task = asyncio.create_task(self._keepalive(ws))
+                    try:
+                        async for msg in ws:
+                            if msg.type != WSMsgType.TEXT:
+                                continue
+                            failures = 0
+
+                            reply, items = self._handle_message(
+                                msg.data, chat_channel_id)
+
+                            if reply is not None:
+                                await ws.send_str(json_dumps(reply))
+
+                            for data in items:
+                                message_count += 1
+                                yield data
+                                log('debug', f'Total number of messages: {message_count}')
+                    finally:
+                        keepalive_task.cancel()
+                        await asyncio.gather(keepalive_task, return_exceptions=True)
+
+            except ClientError as e:
+                # maybe this can be change of cid, retrieve info once more to confirm
+                log('error', f'Websocket Error: {e}')
+
+            # probably only when server requested to close
+            log('info', '### Websocket closed ###')
+
+            # not closed by request, try again
+            is_live, _, _, chat_channel_id = await loop.run_in_executor(
+                None, self.get_channel_detail, live_channel_id)
+            if not is_live:
+                # do not retry if not live
+                return
 
-    def _get_chat_by_channel_id(self, match, params):
-        return self.get_chat_by_channel_id(match.group('channel_id'), params)
+            failures += 1  # Reset once a message is received
+            if failures > 1:
+                # Back off exponentially while no messages can be received
+                delay = min(2 ** (failures - 2), self.max_reconnect_delay)
+                log('info', f'Reconnecting in {delay} seconds')
+                await asyncio.sleep(delay)
 
-    def get_channel_detail(self):
+    def get_channel_detail(self, channel_id):
         for i in range(self.max_retries):
             try:
-                live_info = self._session_get_json(self._LIVE_DETAIL_URL.format(channel_id=self.live_channel_id))['content']
+                live_info = self._session_get_json(self._LIVE_DETAIL_URL.format(channel_id=channel_id))['content']
                 return live_info['status'] == "OPEN", live_info['liveId'], live_info['liveTitle'], live_info['chatChannelId']
             except (JSONDecodeError, RequestException):
                 continue
-        raise UserNotFound(f'Unable to find Chzzk channel: "{self.live_channel_id}"')
+        raise UserNotFound(f'Unable to find Chzzk channel: "{channel_id}"')
 
-    def get_chat_access_token(self):
+    def get_chat_access_token(self, chat_channel_id, cookies):
         for i in range(self.max_retries):
             try:
                 return self._session_get_json(
-                    self._ACCESS_TOKEN_URL.format(chat_channel_id=self.chat_channel_id),
-                    cookies=self.cookies
+                    self._ACCESS_TOKEN_URL.format(chat_channel_id=chat_channel_id),
+                    cookies=cookies
                 )['content']['accessToken']
             except (JSONDecodeError, RequestException):
                 continue
-        raise SiteError(f'Unable to get access token of Chzzk: "{self.chat_channel_id}"')
-
-    def terminate(self):
-        log('info', '###### Terminate ChzzkChatDownloader #######')
-        self.terminated = True
-        if self.websocket:
-            self.websocket.close()
-        if self.websocket_thread:
-            self.websocket_thread.join(timeout=self.timeout)
-            if self.websocket_thread.is_alive():
-                log('error', 'Websocket thread not closed!')
+        raise SiteError(f'Unable to get access token of Chzzk: "{chat_channel_id}"')
 
-    def get_chat_by_channel_id(self, channel_id, params):
-        # First function to be called
+    @staticmethod
+    def _get_no_messages(timeout):
+        # Wait (e.g. for the stream to start) until stopped by the caller
+        while True:
+            time.sleep(timeout)
+            yield {}
 
-        self.live_channel_id = channel_id
-        self.timeout = params.get('message_receive_timeout')
-        self.cookies = {
+    def get_chat_by_channel_id(self, channel_id, params):
+        cookies = {
             "NID_AUT": params.get('NID_AUT', self._DEFAULT_NID_AUT),
             "NID_SES": params.get('NID_SES', self._DEFAULT_NID_SES)
         }
-        if self.session.proxies:
-            proxy_full = self.session.proxies.get('https')
-            if proxy_full:
-                proxy_splitted = proxy_full.split(':')
-                self.proxy_host = proxy_splitted[0]
-                self.proxy_port = proxy_splitted[1] if len(proxy_splitted) > 1 else None
 
         log('info', f'params: {params}')
 
-        # connect websocket before
-        is_live, live_id, live_title = self.connect_websocket()
+        is_live, live_id, live_title, chat_channel_id = self.get_channel_detail(channel_id)
+
+        if is_live:
+            runtime = get_runtime()
+            runtime.add_cleanup(close_shared_session)
+            messages = runtime.iterate(
+                self._get_chat_messages_by_channel_id(
+                    channel_id, chat_channel_id, cookies),
+                params.get('message_receive_timeout')
+            )
+        else:
+            messages = self._get_no_messages(params.get('message_receive_timeout'))
 
         return Chat(
-            self._get_chat_messages_by_channel_id(),
+            messages,
             title=live_title,
             duration=None,
             status='live' if is_live else 'upcoming',  # Always live or upcoming
             video_type='video',
-            id=f"{live_id}:{self.chat_channel_id}"
+            id=f"{live_id}:{chat_channel_id}"
         )
@@ -4,7 +4,6 @@ import socket
 from http.cookiejar import (MozillaCookieJar, Cookie)
 import os
 import re
-from json import JSONDecodeError
 
 from ..errors import (
     InvalidParameter,
@@ -19,13 +18,24 @@ from ..utils.core import (
     get_title_of_webpage,
     pause,
     safe_print,
-    safe_path
+    safe_path,
+    partial_format
+)
+
+from ..utils.json_codec import (
+    json_loads,
+    JSONDecodeError
 )
 
 from ..utils.timed_utils import (
     timed_input,
     interruptible_sleep
 )
+from ..output.continuous_write import (
+    MultiWriter,
+    SharedItem
+)
+
 from ..debugging import log
 
 
@@ -253,24 +263,39 @@ class Chat():
         # Special formatting of output name:
         # Allowed keys are specified here
         # Remove invalid characters from output file name
-        self._output_writer.file_name = self._output_writer.file_name.format(
-            title=safe_path(self.title),
-            id=safe_path(self.id)
-        )
+        # Other fields (e.g. {index} and {start} of a rotating writer) are
+        # kept, so braces in the values are escaped if the writer formats
+        # the file name again
+        def escape(text, writer):
+            text = safe_path(text)
+            if writer.has_rotation_fields():
+                text = text.replace('{', '{{').replace('}', '}}')
+            return text
+
+        if isinstance(self._output_writer, MultiWriter):
+            writers = self._output_writer.writers
+        else:
+            writers = [self._output_writer]
+
+        for writer in writers:
+            writer.file_name = partial_format(
+                writer.file_name,
+                title=escape(self.title, writer),
+                id=escape(self.id, writer)
+            )
 
-        log('debug', f'Writing to file: {self._output_writer.file_name}')
         # Only actually initialise here
         self._output_writer._real_init()
+        for writer in writers:
+            log('debug', f'Writing to file: {writer.segment_name}')
 
-        if self._output_writer.is_default():
-            self._output_callback = lambda item: self._output_writer.write(
-                self.format(item), flush=True)
-        else:
-            self._output_callback = lambda item: self._output_writer.write(
-                item, flush=True)
+        # Items are serialised (and formatted) once, no matter how many files
+        # they are written to, and flushed according to the flush policy
+        self._output_callback = lambda item: self._output_writer.write(
+            SharedItem(item, self.format))
 
     def attach_writer(self, writer):
-        # writer is a ContinuousWriter
+        # writer is a ContinuousWriter or a MultiWriter
         self._output_writer = writer
 
     def __next__(self):
@@ -286,11 +311,15 @@ class Chat():
                 self._init_writer()
 
             if self._output_callback is not None:  # output callback
-                self._output_callback(item)
+                if item:
+                    self._output_callback(item)
+                else:  # No new messages, so write what is being held
+                    self._output_writer.idle()
 
             return item
-        except StopIteration as e:
-            # Safely close output file when done
+        except BaseException as e:
+            # Safely close output file when done (or interrupted), so that
+            # buffered items are not lost
             if self._output_writer is not None:
                 self._output_writer.close()
             raise e
@@ -520,7 +549,7 @@ class BaseChatDownloader:
 
     def _session_get_json(self, url, **kwargs):
         """Make a get request using the current session and return as JSON."""
-        return self._session_get(url, **kwargs).json()
+        return json_loads(self._session_get(url, **kwargs).content)
 
     def get_site_value(self, value):
         """Get the site's default value for a certain parameter
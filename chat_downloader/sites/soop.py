@@ -6,13 +6,13 @@ from .common import (
 from ..debugging import (
     log,
 )
+from ..utils.async_runtime import get_runtime
 import asyncio
-import queue
 
 from .afreeca import AfreecaTV, Chat as AfreecaChat, UserCredential
+from .afreeca.credential import close_shared_session
 from .afreeca.exceptions import NotStreamingError
 from datetime import datetime, timezone
-from threading import Thread
 
 
 class SoopChatDownloader(BaseChatDownloader):
@@ -31,15 +31,14 @@ class SoopChatDownloader(BaseChatDownloader):
     _DEFAULT_ID = 'playsquad'
     _DEFAULT_PW = 'g17JNU]}bI2}n$p'
 
-    queue = queue.Queue()
-
-    async def _chat_callback(self, chat: AfreecaChat):
+    @staticmethod
+    def _parse_chat(chat: AfreecaChat, flag_bitmask=False):
         timestamp = int(datetime.now(timezone.utc).timestamp() * 1e6)
         data = {
             'message_id': f'{chat.sender_id}-{timestamp}',
             'timestamp': timestamp,
             'message': chat.message,
-            'flag': ','.join(chat.flags),
+            'flag': chat.flag_mask if flag_bitmask else ','.join(chat.flags),
             'author': {
                 'id': chat.sender_id,
                 'display_name': chat.nickname,
@@ -48,77 +47,81 @@ class SoopChatDownloader(BaseChatDownloader):
         if chat.subscription_month:
             data['author']['subscription_month'] = chat.subscription_month
 
-        self.queue.put(data)
+        return data
+
+    async def _get_chat_messages(self, chat_loader, params):
+        # Runs in the shared event loop, alongside all other live connections.
+        # Chats are delivered (and moved to the consuming thread) in batches.
+        batches = asyncio.Queue()
+        flag_bitmask = params.get('flag_bitmask')
+
+        def chat_callback(chats):
+            batches.put_nowait([self._parse_chat(chat, flag_bitmask) for chat in chats])
 
-    def afreeca_chat_recv_loop(self):
-        self.loop.run_until_complete(self.chat_loader.loop())
-        self.loop.close()
-        log('debug', 'Async event loop closed...')
+        chat_loader.add_batch_callback(event='chat', callback=chat_callback)
+        receive_task = asyncio.create_task(chat_loader.loop())
+        receive_task.add_done_callback(lambda _: batches.put_nowait(None))
 
-    def _get_chat_messages(self, params):
         try:
-            Thread(target=self.afreeca_chat_recv_loop).start()
             message_count = 0
             while True:
-                try:
-                    data = self.queue.get(timeout=params.get('message_receive_timeout'))
-                except queue.Empty:
-                    yield {}
-                    continue
-
-                message_count += 1
-                yield data
+                batch = await batches.get()
+                if batch is None:  # Connection closed
+                    if not receive_task.cancelled() and receive_task.exception():
+                        log('error', receive_task.exception())
+                    return
+
+                message_count += len(batch)
+                yield batch
                 log('debug', f'Total number of messages: {message_count}')
-        except Exception as e:
-            log('error', e)
         finally:
             log('debug', 'Cleanup afreeca chat downloader')
-            self.chat_loader.remove_callback(self._chat_callback)
-            self.loop.create_task(self.close_all_aiohttp_connections())
+            chat_loader.remove_batch_callback(chat_callback)
+            receive_task.cancel()
+            await self.close_all_aiohttp_connections(chat_loader)
 
     def _get_empty_generator(self):
         yield {}
         return
 
     def _get_chat(self, match, params):
-        self.loop = asyncio.new_event_loop()
-        chat = self.loop.run_until_complete(self.get_chat_by_username(match.group('username'), params))
-        return chat
+        return self.get_chat_by_username(match.group('username'), params)
 
-    async def close_all_aiohttp_connections(self):
+    @staticmethod
+    async def close_all_aiohttp_connections(chat_loader):
+        # The HTTP session is shared by all channels, so it is left open
+        # (until the event loop is closed)
         log('info', 'Close all SoopChatDownloader connections')
-        if self.chat_loader.credential._session:
-            await self.chat_loader.credential._session.close()
-        if self.chat_loader.session:
-            await self.chat_loader.session.close()
-        if self.chat_loader.keepalive_task:
-            self.chat_loader.keepalive_task.cancel()
-        if self.chat_loader.connection:
-            client_websocket_response = self.chat_loader.connection
-            self.chat_loader.connection = None
+        if chat_loader.keepalive_task:
+            chat_loader.keepalive_task.cancel()
+        if chat_loader.connection:
+            client_websocket_response = chat_loader.connection
+            chat_loader.connection = None
             await client_websocket_response.close()
 
-    async def get_chat_by_username(self, username, params):
-        cred = await UserCredential.login(params.get('afreeca-id', self._DEFAULT_ID), params.get('afreeca-pw', self._DEFAULT_PW))
+    async def _connect(self, username, params):
+        # Channels (and reconnections) of the same account share one login
+        cred = await UserCredential.get(
+            params.get('afreeca-id', self._DEFAULT_ID),
+            params.get('afreeca-pw', self._DEFAULT_PW))
         afreeca = AfreecaTV(credential=cred)
 
-        self.chat_loader = await afreeca.create_chat(username)
-        self.chat_loader.add_callback(event='chat', callback=self._chat_callback)
+        chat_loader = await afreeca.create_chat(username)
 
         try:
-            await self.chat_loader.connect()
-            bj_info = self.chat_loader.info
-            return Chat(
-                self._get_chat_messages(params),
-                title=bj_info.title,
-                duration=None,
-                status='live',
-                video_type='video',
-                id=bj_info.bno
-            )
-
+            await chat_loader.connect()
         except NotStreamingError:
-            await self.close_all_aiohttp_connections()
+            await self.close_all_aiohttp_connections(chat_loader)
+            return None
+
+        return chat_loader
+
+    def get_chat_by_username(self, username, params):
+        runtime = get_runtime()
+        runtime.add_cleanup(close_shared_session)
+        chat_loader = runtime.run(self._connect(username, params))
+
+        if chat_loader is None:  # Not streaming
             return Chat(
                 self._get_empty_generator(),
                 title='',
@@ -127,3 +130,17 @@ class SoopChatDownloader(BaseChatDownloader):
                 video_type='video',
                 id=''
             )
+
+        bj_info = chat_loader.info
+        return Chat(
+            runtime.iterate(
+                self._get_chat_messages(chat_loader, params),
+                params.get('message_receive_timeout'),
+                batched=True
+            ),
+            title=bj_info.title,
+            duration=None,
+            status='live',
+            video_type='video',
+            id=bj_info.bno
+        )
@@ -9,7 +9,8 @@ from ..errors import (
     SiteError,
     NoChatReplay,
     VideoUnavailable,
-    UserNotFound
+    UserNotFound,
+    RetriesExceeded
 )
 
 from ..utils.core import (
@@ -24,18 +25,30 @@ from ..utils.core import (
     attempts
 )
 
+from ..utils.json_codec import (
+    json_loads,
+    json_dumpb,
+    JSONDecodeError
+)
+
 from ..debugging import (
     log,
     debug_log
 )
 
 import re
+import os
 import time
 import socket
 import base64
 import math
+import atexit
+import queue
+import selectors
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException
-from json.decoder import JSONDecodeError
 
 
 class TwitchError(SiteError):
@@ -46,50 +59,823 @@ class TwitchError(SiteError):
 # TODO export as another module?
 
 
-class TwitchChatIRC():
+class IRCLineFramer():
+    """Split a stream of bytes into complete IRC lines.
+
+    Incoming bytes are only scanned once for line endings, and a line is only
+    decoded once it is complete. This means that multibyte characters split
+    across two reads are decoded correctly.
+    """
+
+    _LINE_ENDING = b'\r\n'
 
     def __init__(self):
-        # create new socket
-        self.socket = socket.socket()
+        self._pending = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the lines which are now complete.
+
+        :param data: The received bytes
+        :type data: Union[bytes, bytearray, memoryview]
+        :return: The complete lines (without line endings)
+        :rtype: list[str]
+        """
+        pending = self._pending
+
+        # Only search the new data (and the last byte of the old data,
+        # in case the line ending was split across reads)
+        search_start = max(len(pending) - 1, 0)
+        pending += data
+
+        end = pending.rfind(self._LINE_ENDING, search_start)
+        if end == -1:
+            return []
+
+        lines = pending[:end].split(self._LINE_ENDING)
+        del pending[:end + len(self._LINE_ENDING)]
 
-        # start connection
-        self.socket.connect(('irc.chat.twitch.tv', 6667))
+        return [line.decode('utf-8', 'replace') for line in lines]
+
+
+class TwitchChatIRC():
+    _HOST = 'irc.chat.twitch.tv'
+    _PORT = 6667
+
+    def __init__(self, buffer_size=4096, timeout=None):
+        # preallocated buffer which all data is received into
+        self._buffer = bytearray(buffer_size)
+        self._buffer_view = memoryview(self._buffer)
+        self._framer = IRCLineFramer()
+
+        # start connection. The timeout also applies to sending.
+        self.socket = socket.create_connection((self._HOST, self._PORT), timeout)
         # print('Connected to', self._HOST, 'on port', self._PORT)
 
-        self.current_channel = None
+        self.channels = set()
         # https://dev.twitch.tv/docs/irc/tags
         # https://dev.twitch.tv/docs/irc/membership
         # https://dev.twitch.tv/docs/irc/commands
 
-        # twitch.tv/membership
-        self.send_raw(
-            'CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership')
-        self.send_raw('PASS SCHMOOPIIE')
-        self.send_raw('NICK justinfan67420')
+        try:
+            # twitch.tv/membership
+            self.send_raw(
+                'CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership')
+            self.send_raw('PASS SCHMOOPIIE')
+            self.send_raw('NICK justinfan67420')
+        except OSError:
+            self.socket.close()
+            raise
 
     def send_raw(self, string):
-        self.socket.send((string + '\r\n').encode('utf-8'))
+        self.socket.sendall((string + '\r\n').encode('utf-8'))
+
+    def recv_lines(self):
+        """Receive data from the socket and return all complete lines.
 
-    def recv(self, buffer_size):
-        return self.socket.recv(buffer_size).decode('utf-8', 'ignore')
+        :return: The complete lines received, or None if the connection
+            has been closed
+        :rtype: Union[list[str], None]
+        """
+        num_bytes = self.socket.recv_into(self._buffer)
+        if not num_bytes:
+            return None
+
+        return self._framer.feed(self._buffer_view[:num_bytes])
 
     def join_channel(self, channel_name):
         channel_lower = channel_name.lower()
 
-        if self.current_channel != channel_lower:
+        if channel_lower not in self.channels:
             self.send_raw(f'JOIN #{channel_lower}')
-            self.current_channel = channel_lower
+            self.channels.add(channel_lower)
 
-    def set_timeout(self, message_receive_timeout):
-        self.socket.settimeout(message_receive_timeout)
+    def part_channel(self, channel_name):
+        channel_lower = channel_name.lower()
+
+        if channel_lower in self.channels:
+            self.send_raw(f'PART #{channel_lower}')
+            self.channels.discard(channel_lower)
 
     def close_connection(self):
         self.socket.close()
 
 
+class TwitchChatIRCPool():
+    """Share a small number of IRC connections between many channels.
+
+    A single background thread reads from every connection. Each line is
+    parsed once, and the result is routed to the queues which have subscribed
+    to the line's channel. Items are put on queues as `(channel, item)` tuples.
+    If a connection drops, its channels are rejoined on the remaining (or new)
+    connections. Connections are closed, and the thread stops, once there are
+    no subscribers left.
+
+    Each queue receives its own copy of an item, although nested objects
+    (such as badges) are shared and must not be modified. Items are dropped
+    (and a warning is logged) when a queue is full, so that
+    a slow subscriber does not hold up the others. If a connection cannot be
+    opened after `max_attempts` attempts, or reading fails unexpectedly, an
+    exception is put on the queues instead of an item (as a
+    `(channel, exception)` tuple), and the queues are unsubscribed.
+    """
+
+    # Twitch allows 20 JOIN attempts per 10 seconds for regular accounts
+    _MAX_JOINS = 20
+    _JOIN_PERIOD = 10
+
+    _SELECT_TIMEOUT = 1
+
+    def __init__(self, parse_line, buffer_size=4096, channels_per_connection=50, ping_every=60,
+                 max_joins=_MAX_JOINS, join_period=_JOIN_PERIOD, max_attempts=15, retry_timeout=None,
+                 timeout=5):
+        """Create a TwitchChatIRCPool object
+
+        :param parse_line: Function which parses a line, returning a
+            `(channel, item)` tuple, or None if the line should be skipped
+        :type parse_line: function
+        :param buffer_size: Buffer size of each connection, defaults to 4096
+        :type buffer_size: int, optional
+        :param channels_per_connection: Maximum number of channels to join on
+            one connection, defaults to 50
+        :type channels_per_connection: int, optional
+        :param ping_every: How often (in seconds) to ping the server, defaults to 60
+        :type ping_every: float, optional
+        :param max_joins: Maximum number of JOIN commands to send in every
+            `join_period` seconds, defaults to 20
+        :type max_joins: int, optional
+        :param join_period: Length of the JOIN rate limiting window (in seconds),
+            defaults to 10
+        :type join_period: float, optional
+        :param max_attempts: Maximum number of consecutive attempts to open a
+            connection, defaults to 15
+        :type max_attempts: int, optional
+        :param retry_timeout: Number of seconds to wait between attempts,
+            defaults to None (i.e. use exponential back-off)
+        :type retry_timeout: float, optional
+        :param timeout: Maximum number of seconds to wait when connecting to
+            or sending to the server, defaults to 5. All connections are
+            served by one thread, so this limits how long they can be held up.
+        :type timeout: float, optional
+        """
+        self.parse_line = parse_line
+        self.buffer_size = buffer_size or 4096
+        self.channels_per_connection = channels_per_connection
+        self.ping_every = ping_every
+        self.max_joins = max_joins
+        self.join_period = join_period
+        self.max_attempts = max_attempts or 15
+        self.retry_timeout = retry_timeout
+        self.timeout = timeout
+
+        self._subscribers = {}  # channel -> list of queues
+        self._full_queues = set()  # queues which items are being dropped from
+        self._channel_connections = {}  # channel -> TwitchChatIRC
+
+        self._pending_joins = deque()
+        self._pending_parts = deque()
+        self._join_times = deque()
+        self._failed_attempts = 0  # consecutive failures to open a connection
+        self._next_attempt_time = 0
+
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._thread = None
+        self._closed = False
+        self._last_ping_time = time.time()
+
+    def subscribe(self, channels, subscriber_queue):
+        """Route items from the given channels to a queue. Channels are
+        joined if they have not been already.
+
+        :param channels: The channel names
+        :type channels: list[str]
+        :param subscriber_queue: The queue to put items on
+        :type subscriber_queue: queue.Queue
+        """
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.setdefault(channel.lower(), [])
+                if not subscribers:
+                    self._pending_joins.append(channel.lower())
+                subscribers.append(subscriber_queue)
+
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, channels, subscriber_queue):
+        """Stop routing items from the given channels to a queue. Channels
+        without any remaining subscribers are left.
+
+        :param channels: The channel names
+        :type channels: list[str]
+        :param subscriber_queue: The queue which was subscribed
+        :type subscriber_queue: queue.Queue
+        """
+        with self._lock:
+            for channel in channels:
+                channel = channel.lower()
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+
+                if subscriber_queue in subscribers:
+                    subscribers.remove(subscriber_queue)
+                self._full_queues.discard(subscriber_queue)
+
+                if not subscribers:
+                    del self._subscribers[channel]
+                    self._pending_parts.append(channel)
+
+    def close(self):
+        """Stop reading and close all connections."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        else:
+            self._close_connections()
+        self._selector.close()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                with self._lock:
+                    if not self._subscribers:
+                        # Stop until the next subscriber
+                        self._close_connections()
+                        self._thread = None
+                        return
+
+                try:
+                    self._run_once()
+                except Exception as e:
+                    # Start again, without the current subscribers
+                    log('error', f'Twitch IRC connections failed: {e}')
+                    with self._lock:
+                        self._fail(list(self._subscribers), e)
+                    self._close_connections()
+        finally:
+            if self._closed:
+                self._close_connections()
+
+    def _close_connections(self):
+        connections = self._connections()
+        for connection in connections:
+            self._close_connection(connection)
+        self._channel_connections.clear()
+        if connections:
+            log('info', 'Closed Twitch IRC connections')
+
+    def _run_once(self):
+        self._update_channels()
+
+        if not self._selector.get_map():  # Nothing to read from
+            time.sleep(self._SELECT_TIMEOUT)
+            return
+
+        for key, _ in self._selector.select(self._SELECT_TIMEOUT):
+            self._read(key.data)
+
+        self._ping()
+
+    def _connections(self):
+        return [key.data for key in self._selector.get_map().values()]
+
+    def _get_connection(self):
+        # Use the least-loaded connection, or create a new one if all are full
+        connections = [
+            connection for connection in self._connections()
+            if len(connection.channels) < self.channels_per_connection
+        ]
+        if connections:
+            return min(connections, key=lambda x: len(x.channels))
+
+        connection = TwitchChatIRC(self.buffer_size, self.timeout)
+        self._selector.register(
+            connection.socket, selectors.EVENT_READ, connection)
+        log('debug', f'Opened Twitch IRC connection #{len(self._connections())}')
+        return connection
+
+    def _update_channels(self):
+        while self._pending_parts:
+            channel = self._pending_parts.popleft()
+            if channel in self._subscribers:  # Subscribed to again
+                continue
+
+            connection = self._channel_connections.pop(channel, None)
+            if connection is None:
+                continue
+
+            try:
+                connection.part_channel(channel)
+            except OSError:
+                pass  # Handled when reading
+
+            if not connection.channels:
+                self._close_connection(connection)
+
+        now = time.time()
+        while self._join_times and now - self._join_times[0] >= self.join_period:
+            self._join_times.popleft()
+
+        if now < self._next_attempt_time:
+            return  # Waiting to retry
+
+        while self._pending_joins and len(self._join_times) < self.max_joins:
+            channel = self._pending_joins.popleft()
+            if channel not in self._subscribers or channel in self._channel_connections:
+                continue
+
+            try:
+                connection = self._get_connection()
+                connection.join_channel(channel)
+            except OSError as e:
+                self._pending_joins.appendleft(channel)
+                self._retry_joins(e)
+                break
+
+            self._failed_attempts = 0
+            self._channel_connections[channel] = connection
+            self._join_times.append(now)
+
+    def _retry_joins(self, error):
+        self._failed_attempts += 1
+        if self._failed_attempts >= self.max_attempts:
+            log('error', f'Unable to join Twitch channels: {error}')
+            with self._lock:
+                self._fail(self._pending_joins, RetriesExceeded(
+                    f'Maximum number of retries has been reached ({self.max_attempts}).'))
+            self._pending_joins.clear()
+            self._failed_attempts = 0
+            return
+
+        if self.retry_timeout is None:  # use exponential backoff
+            time_to_sleep = 2**(self._failed_attempts - 2) if self._failed_attempts > 1 else 0
+        else:
+            time_to_sleep = self.retry_timeout
+
+        log('warning', f'Unable to join Twitch channels, retry #{self._failed_attempts} '
+            f'(sleep for {time_to_sleep}s): {error}')
+        self._next_attempt_time = time.time() + time_to_sleep
+
+    def _fail(self, channels, error):
+        # Pass the error to the subscribers of the channels, which are
+        # then unsubscribed. The lock must be held.
+        for channel in set(channels):
+            for subscriber_queue in self._subscribers.pop(channel, ()):
+                self._put(subscriber_queue, (channel, error), force=True)
+            self._pending_parts.append(channel)
+
+    def _put(self, subscriber_queue, item, force=False):
+        try:
+            subscriber_queue.put_nowait(item)
+        except queue.Full:
+            if not force:
+                if subscriber_queue not in self._full_queues:
+                    self._full_queues.add(subscriber_queue)
+                    log('warning', 'Twitch chat is not being read quickly enough, dropping messages.')
+                return
+
+            # Make space by dropping the oldest item
+            try:
+                subscriber_queue.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber_queue.put_nowait(item)
+        else:
+            self._full_queues.discard(subscriber_queue)
+
+    def _read(self, connection):
+        try:
+            lines = connection.recv_lines()
+        except OSError as e:
+            log('debug', f'Twitch IRC connection error: {e}')
+            lines = None
+
+        if lines is None:
+            self._drop_connection(connection)
+            return
+
+        for line in lines:
+            if line == TwitchChatDownloader._PING_TEXT:
+                try:
+                    connection.send_raw(TwitchChatDownloader._PONG_TEXT)
+                except OSError:
+                    self._drop_connection(connection)
+                    return
+                continue
+
+            # A line which cannot be parsed must not stop the other lines
+            try:
+                parsed = self.parse_line(line)
+            except Exception as e:
+                log('warning', f'Unable to parse Twitch IRC line "{line}": {e}')
+                continue
+
+            if parsed is None:
+                continue
+
+            channel, item = parsed
+            for index, subscriber_queue in enumerate(tuple(self._subscribers.get(channel, ()))):
+                # Each subscriber may modify its item
+                self._put(subscriber_queue, (channel, dict(item) if index else item))
+
+    def _ping(self):
+        current_time = time.time()
+        if current_time - self._last_ping_time <= self.ping_every:
+            return
+
+        self._last_ping_time = current_time
+        for connection in self._connections():
+            try:
+                connection.send_raw('PING')
+            except OSError:
+                self._drop_connection(connection)
+
+    def _close_connection(self, connection):
+        try:
+            self._selector.unregister(connection.socket)
+        except (KeyError, ValueError):
+            pass  # Not registered
+        connection.close_connection()
+
+    def _drop_connection(self, connection):
+        # Rejoin (rebalance) channels which were joined on this connection
+        log('debug', f'Lost Twitch IRC connection, rejoining {len(connection.channels)} channel(s).')
+        self._close_connection(connection)
+
+        for channel in connection.channels:
+            self._channel_connections.pop(channel, None)
+            self._pending_joins.appendleft(channel)
+        connection.channels.clear()
+
+
+class _GQLCall():
+    def __init__(self, ops):
+        self.ops = ops
+        self.results = [None] * len(ops)
+        self.remaining = len(ops)
+        self.response = None  # Set if the response could not be split
+        self.error = None
+        self.done = threading.Event()
+
+
+class GQLBatcher():
+    """Coalesce GQL operations made by concurrent callers into batched requests.
+
+    Operations are queued and picked up by a small pool of worker threads.
+    Each worker sends all queued operations (up to `max_batch_size`) in a
+    single request and hands the results back to their callers. A lone
+    caller is therefore served immediately, while callers making requests
+    at the same time share a request.
+    """
+
+    # Twitch rejects batches of more than 35 operations
+    _MAX_BATCH_SIZE = 35
+
+    def __init__(self, post, max_batch_size=_MAX_BATCH_SIZE, max_workers=4):
+        """Create a GQLBatcher object
+
+        :param post: Function which sends a list of operations in a single
+            request, returning the decoded response
+        :type post: function
+        :param max_batch_size: Maximum number of operations to send in one
+            request, defaults to 35
+        :type max_batch_size: int, optional
+        :param max_workers: Maximum number of requests to make at the same
+            time, defaults to 4
+        :type max_workers: int, optional
+        """
+        self.post = post
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def request(self, ops):
+        """Send a list of operations, possibly along with those of other callers.
+
+        :param ops: The operations
+        :type ops: list[dict]
+        :raises Exception: any exception raised while sending the operations
+        :return: The result of each operation, in order
+        :rtype: list
+        """
+        call = _GQLCall(ops)
+        if not ops:
+            return call.results
+
+        with self._lock:
+            if not self._workers:
+                for _ in range(self.max_workers):
+                    worker = threading.Thread(target=self._run, daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+
+        for index in range(len(ops)):
+            self._queue.put((call, index))
+
+        call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+
+        if call.response is not None:
+            return call.response
+
+        return call.results
+
+    def close(self):
+        """Stop the worker threads once the queued operations have been sent."""
+        with self._lock:
+            for _ in self._workers:
+                self._queue.put(None)
+            self._workers = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is None:  # Leave the stop signal for later
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                response = self.post([call.ops[index] for call, index in batch])
+            except Exception as e:
+                for call, _ in batch:
+                    call.error = e
+                    call.done.set()
+                continue
+
+            split = isinstance(response, list) and len(response) == len(batch)
+
+            with self._lock:
+                for i, (call, index) in enumerate(batch):
+                    if split:
+                        call.results[index] = response[i]
+                    else:  # e.g. an error object, give it to every caller
+                        call.response = response
+
+                    call.remaining -= 1
+                    if call.remaining == 0:
+                        call.done.set()
+
+
+class TwitchBadgeCatalog():
+    """Cache of the chat badges available in Twitch channels.
+
+    Badges are stored per channel, along with the time they were fetched.
+    Channels whose badges are older than `ttl` seconds are considered stale,
+    and only the `max_channels` most recently used channels are kept in memory.
+    Channels which are pinned (e.g. because their chat is being downloaded)
+    are never evicted. Global badges are shared by all channels. Channel
+    names are case-insensitive.
+
+    If a path is given, the catalog is also saved to (and loaded from) a JSON
+    file, so that it can be reused across runs. Updates are saved at most once
+    every `save_interval` seconds, and when the catalog is flushed.
+    """
+
+    _TTL = 3600
+    _MAX_CHANNELS = 256
+    _SAVE_INTERVAL = 60
+
+    def __init__(self, ttl=_TTL, max_channels=_MAX_CHANNELS, path=None, save_interval=_SAVE_INTERVAL):
+        """Create a TwitchBadgeCatalog object
+
+        :param ttl: Number of seconds for which a channel's badges are
+            considered fresh, defaults to 3600
+        :type ttl: float, optional
+        :param max_channels: Maximum number of channels to keep, defaults to 256
+        :type max_channels: int, optional
+        :param path: Path of the file to store the catalog in, defaults to None
+        :type path: str, optional
+        :param save_interval: Minimum number of seconds between saves of the
+            catalog, defaults to 60
+        :type save_interval: float, optional
+        """
+        self.ttl = ttl
+        self.max_channels = max_channels
+        self.path = None
+        self.save_interval = save_interval
+
+        self._global_badges = {}  # (set id, version) -> badge
+        self._global_raw = []
+
+        # channel name -> (fetch time, channel id, {(set id, version): badge}, raw badges)
+        self._channels = OrderedDict()
+        self._channel_names = {}  # channel id -> channel name
+        self._pinned = {}  # channel name -> number of pins
+
+        # Incremented whenever the badges change, so that objects built from
+        # them know when to be rebuilt
+        self.revision = 0
+
+        self._lock = threading.Lock()
+        self._last_save_time = 0
+        self._unsaved = False
+
+        if path:
+            self.load(path)
+
+    def pin(self, channel):
+        """Prevent a channel's badges from being evicted, until it is unpinned
+        (as many times as it was pinned).
+
+        :param channel: The channel name
+        :type channel: str
+        """
+        channel = channel.lower()
+        with self._lock:
+            self._pinned[channel] = self._pinned.get(channel, 0) + 1
+
+    def unpin(self, channel):
+        """Allow a pinned channel's badges to be evicted again.
+
+        :param channel: The channel name
+        :type channel: str
+        """
+        channel = channel.lower()
+        with self._lock:
+            pins = self._pinned.pop(channel, 0) - 1
+            if pins > 0:
+                self._pinned[channel] = pins
+            self._evict()
+
+    def is_fresh(self, channel):
+        """Check whether a channel's badges were fetched less than `ttl` seconds ago.
+
+        :param channel: The channel name
+        :type channel: str
+        :return: True if the channel's badges need not be fetched again
+        :rtype: bool
+        """
+        with self._lock:
+            entry = self._channels.get(channel.lower())
+            return entry is not None and time.time() - entry[0] < self.ttl
+
+    def update(self, channel, global_badges, channel_badges, fetch_time=None, save=True):
+        """Store the badges of a channel, as returned by the `ChatList_Badges` operation.
+
+        :param channel: The channel name
+        :type channel: str
+        :param global_badges: Badges available in all channels
+        :type global_badges: list[dict]
+        :param channel_badges: Badges specific to the channel
+        :type channel_badges: list[dict]
+        :param fetch_time: When the badges were fetched, defaults to now
+        :type fetch_time: float, optional
+        :param save: Whether to save the catalog to its file (if any),
+            defaults to True
+        :type save: bool, optional
+        """
+        if fetch_time is None:
+            fetch_time = time.time()
+
+        channel = channel.lower()
+        channel_id = None
+        badges = {}
+        with self._lock:
+            for badge in global_badges + channel_badges:
+                set_id, version, badge_channel_id = base64.b64decode(
+                    badge['id']).decode().strip().split(';')
+
+                if badge_channel_id:
+                    channel_id = badge_channel_id
+                    badges[(set_id, version)] = badge
+                else:
+                    self._global_badges[(set_id, version)] = badge
+
+            if global_badges:
+                self._global_raw = global_badges
+
+            self._channels.pop(channel, None)
+            self._channels[channel] = (
+                fetch_time, channel_id, badges, channel_badges)
+            if channel_id:
+                self._channel_names[channel_id] = channel
+
+            self._evict()
+
+            self.revision += 1
+            self._unsaved = True
+            save = save and time.time() - self._last_save_time >= self.save_interval
+
+        if save and self.path:
+            self.save()
+
+    def _evict(self):
+        # Remove the least recently used channels which are not pinned.
+        # The lock must be held.
+        excess = len(self._channels) - self.max_channels
+        for channel in list(self._channels):
+            if excess <= 0:
+                break
+            if channel in self._pinned:
+                continue
+
+            _, old_id, _, _ = self._channels.pop(channel)
+            if old_id and self._channel_names.get(old_id) not in self._channels:
+                del self._channel_names[old_id]
+            excess -= 1
+            self.revision += 1
+
+    def get(self, set_id, version, channel_id=None):
+        """Get information about a badge. Channel specific badges (e.g.
+        subscriber and bits badges) take priority over global badges.
+
+        :param set_id: The name of the badge
+        :type set_id: str
+        :param version: The version of the badge
+        :type version: str
+        :param channel_id: ID of the channel the badge is used in, defaults to None
+        :type channel_id: str, optional
+        :return: The badge, or None if it is unknown
+        :rtype: dict
+        """
+        with self._lock:
+            if channel_id is not None:
+                channel = self._channel_names.get(str(channel_id))
+                entry = self._channels.get(channel)
+                if entry is not None:
+                    self._channels.move_to_end(channel)
+                    badge = entry[2].get((set_id, version))
+                    if badge:
+                        return badge
+
+            return self._global_badges.get((set_id, version))
+
+    def load(self, path):
+        """Load (and use) the catalog stored in a file. Nothing is loaded if
+        the file does not exist or is invalid.
+
+        :param path: Path of the file
+        :type path: str
+        """
+        if self.path is None:
+            atexit.register(self.flush)
+        self.path = path
+        try:
+            with open(path, 'rb') as f:
+                stored = json_loads(f.read())
+            channels = stored['channels']
+            global_badges = stored.get('global') or []
+        except (OSError, JSONDecodeError, KeyError, TypeError) as e:
+            log('debug', f'Unable to load badge catalog from "{path}": {e}')
+            return
+
+        now = time.time()
+        for channel, entry in sorted(channels.items(), key=lambda x: x[1]['time']):
+            if now - entry['time'] < self.ttl:
+                self.update(channel, global_badges,
+                            entry['badges'], entry['time'], save=False)
+
+    def flush(self):
+        """Save the catalog to its file, if it has changed since it was last saved."""
+        if self._unsaved and self.path:
+            self.save()
+
+    def save(self):
+        """Save the catalog to its file."""
+        with self._lock:
+            self._last_save_time = time.time()
+            self._unsaved = False
+            stored = {
+                'global': self._global_raw,
+                'channels': {
+                    channel: {'time': fetch_time, 'badges': raw}
+                    for channel, (fetch_time, _, _, raw) in self._channels.items()
+                }
+            }
+            data = json_dumpb(stored)
+
+        temp_path = f'{self.path}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            log('debug', f'Unable to save badge catalog to "{self.path}": {e}')
+
+
 class TwitchChatDownloader(BaseChatDownloader):
-    _BADGE_INFO = {}
-    _SUBSCRIBER_BADGE_INFO = {}  # local cache for subscriber badge info
+    _BADGE_CATALOG = TwitchBadgeCatalog()  # shared by all sessions
 
     _NAME = 'twitch.tv'
 
@@ -201,6 +987,10 @@ class TwitchChatDownloader(BaseChatDownloader):
 
     _GQL_API_URL = 'https://gql.twitch.tv/gql'
 
+    # Length (in seconds) of each segment of a past broadcast
+    # when downloading its comments in parallel
+    _VOD_SEGMENT_DURATION = 600
+
     _PING_TEXT = 'PING :tmi.twitch.tv'
     _PONG_TEXT = 'PONG :tmi.twitch.tv'
 
@@ -277,19 +1067,47 @@ class TwitchChatDownloader(BaseChatDownloader):
         return text.replace(r'\:', ';').replace(r'\s', ' ')
 
     @staticmethod
-    def _generate_emote_image_list(emote_id):
-        emote_image_list = []
-        for theme in ('light', 'dark'):
-            for size in ((28, '1.0'), (56, '2.0'), (112, '3.0')):
-                image = Image(
-                    TwitchChatDownloader._EMOTE_URL_TEMPLATE.format(
-                        emote_id, theme, size[1]),
-                    size[0],
-                    size[0],
-                    f'{size[0]}x{size[0]}-{theme}'
-                ).json()
-
-                emote_image_list.append(image)
+    def _decode_pseudo_BNF_if_escaped(text):
+        if '\\' in text:
+            return TwitchChatDownloader._decode_pseudo_BNF(text)
+        return text
+
+    # Badge and emote objects are built once and shared between messages,
+    # so they must be treated as read-only. Callers which need to modify
+    # them should request a copy.
+    _MAX_CACHED_OBJECTS = 8192
+    _EMOTE_IMAGE_LISTS = {}  # emote id -> list of images
+    _BADGES = {}  # (name, version, channel id) -> (catalog revision, badge)
+
+    @staticmethod
+    def _cache_object(cache, key, value):
+        if len(cache) >= TwitchChatDownloader._MAX_CACHED_OBJECTS:
+            cache.clear()
+        cache[key] = value
+
+    @staticmethod
+    def _generate_emote_image_list(emote_id, copy=False):
+        emote_image_list = TwitchChatDownloader._EMOTE_IMAGE_LISTS.get(emote_id)
+
+        if emote_image_list is None:
+            emote_image_list = []
+            for theme in ('light', 'dark'):
+                for size in ((28, '1.0'), (56, '2.0'), (112, '3.0')):
+                    image = Image(
+                        TwitchChatDownloader._EMOTE_URL_TEMPLATE.format(
+                            emote_id, theme, size[1]),
+                        size[0],
+                        size[0],
+                        f'{size[0]}x{size[0]}-{theme}'
+                    ).json()
+
+                    emote_image_list.append(image)
+
+            TwitchChatDownloader._cache_object(
+                TwitchChatDownloader._EMOTE_IMAGE_LISTS, emote_id, emote_image_list)
+
+        if copy:
+            return [dict(image) for image in emote_image_list]
         return emote_image_list
 
     _EMOTE_REGEX = r'(\w+):([\d,-]+)'
@@ -557,10 +1375,54 @@ class TwitchChatDownloader(BaseChatDownloader):
         'action_type',
         'author',
         'in_reply_to',
-        'message'
+        'message',
+
+        # merged livestreams
+        'channel'
     }
     _KNOWN_IRC_KEYS.update(BaseChatDownloader.get_mapped_keys(_IRC_REMAPPING))
 
+    @staticmethod
+    def _get_irc_key_destination(key):
+        """Get where a parsed IRC tag should be stored. This is equivalent to
+        moving the keys into nested dictionaries using `_move_to_dict`
+        ('in_reply_to', then 'author').
+
+        :return: The index of the destination dictionary (0: message,
+            1: author, 2: in_reply_to, 3: in_reply_to's author) and the new key
+        :rtype: (int, str)
+        """
+        if 'in_reply_to_' in key:
+            key = key.replace('in_reply_to_', '')
+            if 'author_' in key:
+                return 3, key.replace('author_', '')
+            return 2, key
+
+        if 'author_' in key:
+            return 1, key.replace('author_', '')
+
+        return 0, key
+
+    # Precomputed lookup table for IRC tags:
+    # tag -> (destination index, new key, remap function)
+    _IRC_TAG_TABLE = {}
+    for _tag, _remap in _IRC_REMAPPING.items():
+        if isinstance(_remap, r):
+            _new_key, _function = _remap.new_key, _remap.remap_function
+            if _function is _decode_pseudo_BNF.__func__:
+                _function = _decode_pseudo_BNF_if_escaped.__func__
+        else:
+            _new_key, _function = _remap, None
+
+        _IRC_TAG_TABLE[_tag] = (
+            *_get_irc_key_destination.__func__(_new_key), _function)
+    del _tag, _remap, _new_key, _function
+
+    # Entries for tags which are not in the table. Unknown tags come from
+    # the server, so only a limited number of them are kept.
+    _UNKNOWN_IRC_TAGS = {}
+    _MAX_UNKNOWN_IRC_TAGS = 256
+
     _ACTION_TYPE_REMAPPING = {
         # tags
         'CLEARCHAT': 'clear_chat',
@@ -780,7 +1642,16 @@ class TwitchChatDownloader(BaseChatDownloader):
             _MESSAGE_GROUPS[_message_group] = []
         _MESSAGE_GROUPS[_message_group] += list(_value.values())
 
-    def _update_badge_info(self, channel):
+    def _update_badge_info(self, channel, params):
+        catalog = TwitchChatDownloader._BADGE_CATALOG
+
+        badge_cache = params.get('badge_cache')
+        if badge_cache and badge_cache != catalog.path:
+            catalog.load(badge_cache)
+
+        if catalog.is_fresh(channel):
+            return
+
         query = [{
             'operationName': 'ChatList_Badges',
             'variables': {
@@ -789,20 +1660,11 @@ class TwitchChatDownloader(BaseChatDownloader):
         }]
         data = multi_get(self._download_gql(query), 0, 'data') or {}
 
-        badges = data.get('badges') or []
-        user = multi_get(data, 'user', 'broadcastBadges') or []
-        for badge in badges + user:
-            setID, version, channelID = base64.b64decode(
-                badge['id']).decode().strip().split(';')
-
-            if channelID:
-                if channelID not in self._SUBSCRIBER_BADGE_INFO:
-                    self._SUBSCRIBER_BADGE_INFO[channelID] = {}
-
-                self._SUBSCRIBER_BADGE_INFO[channelID][(
-                    setID, version)] = badge
-            else:
-                self._BADGE_INFO[(setID, version)] = badge
+        catalog.update(
+            channel,
+            data.get('badges') or [],
+            multi_get(data, 'user', 'broadcastBadges') or []
+        )
 
     @staticmethod
     def _parse_item(item, offset, channel_id=None):
@@ -857,10 +1719,14 @@ class TwitchChatDownloader(BaseChatDownloader):
     }
 
     def _download_base_gql(self, ops):
-        return self._session_post(self._GQL_API_URL, json=ops, headers={
+        response = self._session_post(self._GQL_API_URL, data=json_dumpb(ops), headers={
             'Content-Type': 'text/plain;charset=UTF-8',
             'Client-ID': self._CLIENT_ID
-        }).json()
+        })
+        return json_loads(response.content)
+
+    _gql_batcher = None
+    _gql_batcher_lock = threading.Lock()
 
     def _download_gql(self, ops):
         for op in ops:
@@ -870,7 +1736,14 @@ class TwitchChatDownloader(BaseChatDownloader):
                     'sha256Hash': self._OPERATION_HASHES[op['operationName']],
                 }
             }
-        return self._download_base_gql(ops)
+
+        # Operations made at the same time (e.g. by parallel jobs)
+        # are sent together in as few requests as possible
+        with self._gql_batcher_lock:
+            if self._gql_batcher is None:
+                self._gql_batcher = GQLBatcher(self._download_base_gql)
+            batcher = self._gql_batcher
+        return batcher.request(ops)
 
     _GAME_REMAPPING = {
         'id': 'id',
@@ -1121,7 +1994,8 @@ class TwitchChatDownloader(BaseChatDownloader):
             params.get('start_time'), 0)
 
         e_time = params.get('end_time')
-        if offset is None:  # is a vod
+        is_vod = offset is None
+        if is_vod:
             offset = 0
             end_time = ensure_seconds(e_time)
             content_offset_seconds = min(start_time, max_duration)
@@ -1131,54 +2005,38 @@ class TwitchChatDownloader(BaseChatDownloader):
             end_time = ensure_seconds(e_time, max_duration)
             content_offset_seconds = (start_time or 0) + offset
 
-        max_attempts = params.get('max_attempts')
-
         messages_groups_to_add = params.get('message_groups') or []
         messages_types_to_add = params.get('message_types') or []
 
-        # api_url = self._API_TEMPLATE.format(vod_id, self._CLIENT_ID)
-
-        message_count = 0
-        # do not need inactivity timeout (not live)
-
-        cursor = ''
-        while True:
-            variables = {
-                'videoID': vod_id,
-            }
-
-            if cursor:
-                variables['cursor'] = cursor
-            else:
-                variables['contentOffsetSeconds'] = content_offset_seconds
+        max_concurrent_segments = params.get('max_concurrent_segments') or 1
 
-            query = [{
-                'operationName': 'VideoCommentsByOffsetOrCursor',
-                'variables': variables
-            }]
+        # Offset of the last comment to download
+        end_offset = None if end_time is None else end_time + offset
 
-            for attempt_number in attempts(max_attempts):
-                try:
-                    info = self._download_gql(query)[0]['data']['video']
-                    break
-                except (JSONDecodeError, RequestException) as e:
-                    self.retry(attempt_number, error=e, **params)
+        if is_vod and max_concurrent_segments > 1 and max_duration:
+            # Past broadcasts are split into fixed windows of time,
+            # which are downloaded in parallel
+            segment_end = max_duration if end_time is None else min(
+                end_time, max_duration)
 
-            comments = info.get('comments')
-            if not comments:
-                break
+            boundaries = []
+            boundary = content_offset_seconds
+            while boundary < segment_end:
+                boundaries.append(boundary)
+                boundary += self._VOD_SEGMENT_DURATION
 
-            # Used for custom badge retrieval
-            creator_channel_id = multi_get(info, 'creator', 'channel', 'id')
+            nodes = self._download_vod_segments(
+                vod_id, boundaries or [content_offset_seconds], end_offset, params, max_concurrent_segments)
 
-            edges = comments.get('edges') or []
+        else:  # Clips are short enough to download sequentially
+            nodes = self._download_vod_segment(
+                vod_id, content_offset_seconds, end_offset, params)
 
-            for edge in edges:
-                cursor = edge.get('cursor')
-                node = edge.get('node')
-                if not node:
-                    continue
+        message_count = 0
+        # do not need inactivity timeout (not live)
 
+        try:
+            for node, creator_channel_id in nodes:
                 data = self._parse_item(node, offset, creator_channel_id)
 
                 # test for missing keys
@@ -1216,10 +2074,143 @@ class TwitchChatDownloader(BaseChatDownloader):
                 message_count += 1
                 yield data
 
+        finally:
+            nodes.close()  # Stop any outstanding downloads
             log('debug', f'Total number of messages: {message_count}')
 
+    def _download_vod_segment(self, vod_id, start, end, params, stop=None):
+        """Download the comments of a VOD between two offsets.
+
+        :param vod_id: The ID of the VOD
+        :type vod_id: str
+        :param start: Offset (in seconds) to start downloading from
+        :type start: float
+        :param end: Offset (in seconds) to stop downloading at (inclusive).
+            If None, download until the end of the VOD.
+        :type end: float
+        :param params: Parameters of the chat
+        :type params: dict
+        :param stop: Event which, once set, stops the download
+        :type stop: threading.Event, optional
+        :return: A generator of (comment node, creator channel id) pairs
+        :rtype: Generator[tuple]
+        """
+        max_attempts = params.get('max_attempts')
+
+        cursor = ''
+        while stop is None or not stop.is_set():
+            variables = {
+                'videoID': vod_id,
+            }
+
+            if cursor:
+                variables['cursor'] = cursor
+            else:
+                variables['contentOffsetSeconds'] = start
+
+            query = [{
+                'operationName': 'VideoCommentsByOffsetOrCursor',
+                'variables': variables
+            }]
+
+            for attempt_number in attempts(max_attempts):
+                try:
+                    info = self._download_gql(query)[0]['data']['video']
+                    break
+                except (JSONDecodeError, RequestException) as e:
+                    self.retry(attempt_number, error=e, **params)
+
+            comments = info.get('comments')
+            if not comments:
+                return
+
+            # Used for custom badge retrieval
+            creator_channel_id = multi_get(info, 'creator', 'channel', 'id')
+
+            for edge in comments.get('edges') or []:
+                cursor = edge.get('cursor')
+                node = edge.get('node')
+                if not node:
+                    continue
+
+                content_offset = node.get('contentOffsetSeconds') or 0
+                if content_offset < start:  # Belongs to the previous segment
+                    continue
+                if end is not None and content_offset > end:
+                    return
+
+                yield node, creator_channel_id
+
             if not comments['pageInfo']['hasNextPage']:
-                break
+                return
+
+    def _download_vod_segments(self, vod_id, boundaries, end, params, max_workers):
+        """Download consecutive segments of a VOD in parallel.
+
+        Up to `max_workers` segments are downloaded at a time. Comments are
+        yielded in order, one segment after the other, and comments which
+        appear at the seam of two segments are only yielded once. Comments of
+        the first outstanding segment are yielded as soon as they are
+        downloaded, while those of later segments are held until it is done.
+
+        :param vod_id: The ID of the VOD
+        :type vod_id: str
+        :param boundaries: Start offsets (in seconds) of the segments
+        :type boundaries: list
+        :param end: Offset (in seconds) at which the last segment ends. If
+            None, the last segment continues until the end of the VOD.
+        :type end: float
+        :param params: Parameters of the chat
+        :type params: dict
+        :param max_workers: Maximum number of segments to download at a time
+        :type max_workers: int
+        :return: A generator of (comment node, creator channel id) pairs
+        :rtype: Generator[tuple]
+        """
+        stop = threading.Event()
+        done = object()  # Marks the end of a segment
+
+        def download(index, output):
+            segment_end = boundaries[index + 1] if index + 1 < len(boundaries) else end
+            try:
+                for pair in self._download_vod_segment(
+                        vod_id, boundaries[index], segment_end, params, stop):
+                    if stop.is_set():
+                        return
+                    output.put(pair)
+            finally:
+                output.put(done)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        segments = deque()
+        next_segment = 0
+        previous_ids = set()
+        try:
+            while segments or next_segment < len(boundaries):
+                while next_segment < len(boundaries) and len(segments) < max_workers:
+                    output = queue.Queue()
+                    segments.append(
+                        (executor.submit(download, next_segment, output), output))
+                    next_segment += 1
+
+                future, output = segments.popleft()
+                segment_ids = set()
+                for node, creator_channel_id in iter(output.get, done):
+                    comment_id = node.get('id')
+                    if comment_id in previous_ids:
+                        continue
+                    segment_ids.add(comment_id)
+                    yield node, creator_channel_id
+
+                future.result()  # Raise any error of the segment
+                previous_ids = segment_ids
+
+        finally:
+            # Stop outstanding segments from making further requests
+            stop.set()
+            for future, _ in segments:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def _get_chat_by_vod_id(self, match, params):
         return self.get_chat_by_vod_id(match.group('id'), params)
@@ -1249,7 +2240,7 @@ class TwitchChatDownloader(BaseChatDownloader):
         duration = video.get('lengthSeconds')
 
         channel_name = multi_get(video, 'owner', 'login')
-        self._update_badge_info(channel_name)
+        self._update_badge_info(channel_name, params)
 
         return Chat(
             self._get_chat_messages_by_vod_id(
@@ -1291,7 +2282,7 @@ class TwitchChatDownloader(BaseChatDownloader):
         title = f"{clip.get('title')} ({clip_id})"
 
         channel_name = multi_get(clip, 'broadcaster', 'login')
-        self._update_badge_info(channel_name)
+        self._update_badge_info(channel_name, params)
 
         return Chat(
             self._get_chat_messages_by_vod_id(
@@ -1305,44 +2296,54 @@ class TwitchChatDownloader(BaseChatDownloader):
 
     _MESSAGE_REGEX = re.compile(
         # r'^@(.+?(?=\s+:)).*tmi\.twitch\.tv\s+(\S+)(?:[^#\r\n]+#)?\s(?:\S+)?(?:\s:([^\r\n]*))?', re.MULTILINE)
-        r'^@(.+?(?=\s+:))\s+:(.*)?tmi\.twitch\.tv\s+(\S+)(?:[^#\r\n]+#)?\s(?:\S+)?(?:\s:([^\r\n]*))?', re.MULTILINE)
+        r'^@(.+?(?=\s+:))\s+:(.*)?tmi\.twitch\.tv\s+(\S+)(?:[^#\r\n]+#)?\s(\S+)?(?:\s:([^\r\n]*))?', re.MULTILINE)
     # Groups:
     # 1. Tag info
     # 2. ?User name
     # 3. Action type
-    # 4. Message
+    # 4. ?Target (e.g. #channel)
+    # 5. Message
 
     _BADGE_KEYS = ('title', 'image1x', 'image2x',
                    'image4x', 'clickAction', 'clickURL')
 
     @staticmethod
-    def _parse_badge_info(name, version, channel_id=None):
-        new_badge = {
-            'name': replace_with_underscores(name),
-            'version': int_or_none(version, version)
-        }
+    def _parse_badge_info(name, version, channel_id=None, copy=False):
+        # Only rebuild the badge if the catalog has changed since it was built
+        catalog = TwitchChatDownloader._BADGE_CATALOG
+        revision = catalog.revision
+        key = (name, version, channel_id)
+        cached = TwitchChatDownloader._BADGES.get(key)
+        if cached is not None and cached[0] == revision:
+            new_badge = cached[1]
+
+        else:
+            # prioritise custom emotes (e.g. subscriber and bits)
+            new_badge_info = catalog.get(name, version, channel_id)
 
-        # prioritise custom emotes (e.g. subscriber and bits)
-        new_badge_info = None
-        if channel_id is not None:
-            new_badge_info = multi_get(
-                TwitchChatDownloader._SUBSCRIBER_BADGE_INFO, str(channel_id), (name, version))
+            new_badge = {
+                'name': replace_with_underscores(name),
+                'version': int_or_none(version, version)
+            }
 
-        if not new_badge_info:
-            new_badge_info = multi_get(
-                TwitchChatDownloader._BADGE_INFO, (name, version))
+            if new_badge_info:
+                for key_name in TwitchChatDownloader._BADGE_KEYS:
+                    new_badge[key_name] = new_badge_info.get(key_name)
 
-        if new_badge_info:
-            for key in TwitchChatDownloader._BADGE_KEYS:
-                new_badge[key] = new_badge_info.get(key)
+                image_urls = [
+                    (new_badge.pop(f'image{i}x', ''), i * 18) for i in (1, 2, 4)]
 
-            image_urls = [
-                (new_badge.pop(f'image{i}x', ''), i * 18) for i in (1, 2, 4)]
+                new_badge['icons'] = []
+                for image_url, size in image_urls:
+                    new_badge['icons'].append(Image(image_url, size, size).json())
 
-            new_badge['icons'] = []
-            for image_url, size in image_urls:
-                new_badge['icons'].append(Image(image_url, size, size).json())
+            TwitchChatDownloader._cache_object(
+                TwitchChatDownloader._BADGES, key, (revision, new_badge))
 
+        if copy:
+            new_badge = dict(new_badge)
+            if 'icons' in new_badge:
+                new_badge['icons'] = [dict(icon) for icon in new_badge['icons']]
         return new_badge
 
     @staticmethod
@@ -1390,30 +2391,59 @@ class TwitchChatDownloader(BaseChatDownloader):
                 continue
 
     @staticmethod
-    def _parse_irc_item(match):
-        info = {}
-
-        split_info = match.group(1).split(';')
+    def _parse_irc_tags(tags):
+        """Parse the tags of an IRC message.
+
+        :param tags: The tags, e.g. 'color=#FF0000;display-name=Name;...'
+        :type tags: str
+        :return: The message, author, in_reply_to and in_reply_to's author
+            dictionaries
+        :rtype: (dict, dict, dict, dict)
+        """
+        parsed = ({}, {}, {}, {})
 
-        for item in split_info:
-            keys = item.split('=', 1)
-            key_length = len(keys)
-            if key_length == 1:
+        tag_table = TwitchChatDownloader._IRC_TAG_TABLE
+        unknown_tags = TwitchChatDownloader._UNKNOWN_IRC_TAGS
+        for item in tags.split(';'):
+            key, has_value, value = item.partition('=')
+            if not has_value:
                 # If there's no equals, we assign the tag a value of true.
-                keys.append(True)
-            elif key_length == 2:
-                pass
-            else:  # TODO never reaches this
-                debug_log(
-                    f'Invalid item found: {item}.',
-                    f'All items: {split_info}.',
-                )
+                value = True
+
+            entry = tag_table.get(key) or unknown_tags.get(key)
+            if entry is None:  # Unknown tag, keep with underscores
+                entry = (*TwitchChatDownloader._get_irc_key_destination(
+                    replace_with_underscores(key)), None)
+                if len(unknown_tags) >= TwitchChatDownloader._MAX_UNKNOWN_IRC_TAGS:
+                    unknown_tags.clear()
+                unknown_tags[key] = entry
+
+            destination, new_key, remap_function = entry
+            if remap_function is not None:
+                value = remap_function(value)
+
+            # Only keep nested items which contain information
+            if destination and value in (None, [], {}):
                 continue
 
-            r.remap(info, TwitchChatDownloader._IRC_REMAPPING,
-                    keys[0], keys[1], keep_unknown_keys=True, replace_char_with_underscores='-')
+            parsed[destination][new_key] = value
+
+        return parsed
+
+    @staticmethod
+    def _get_subscriber_months(badge_info):
+        for badge in badge_info.split(','):
+            name, _, version = badge.partition('/')
+            if name == 'subscriber':
+                return int_or_none(version, 0)
+        return None
+
+    @staticmethod
+    def _parse_irc_item(match):
+        info, author, in_reply_to, in_reply_to_author = TwitchChatDownloader._parse_irc_tags(
+            match.group(1))
 
-        message_match = match.group(4)
+        message_match = match.group(5)
         if message_match:
             info['message'] = remove_prefixes(message_match, '\u0001ACTION ')
 
@@ -1423,35 +2453,38 @@ class TwitchChatDownloader(BaseChatDownloader):
                     info['message'], emotes)
                 info['emotes'] = emotes
 
-        author_badge_metadata = info.pop('author_badge_metadata', [])
-        author_badges = info.pop('author_badges', [])
-
-        info['author_badges'] = TwitchChatDownloader._parse_irc_badges(
-            author_badges, info.get('channel_id'))
-
-        badge_metadata = TwitchChatDownloader._parse_irc_badges(
-            author_badge_metadata, info.get('channel_id'))
+        badge_info = author.pop('badge_metadata', None)
+        badges = TwitchChatDownloader._parse_irc_badges(
+            author.pop('badges', None), info.get('channel_id'))
 
-        subscriber_badge = next(
-            (x for x in info['author_badges'] if x.get('name') == 'subscriber'), None)
-        subscriber_badge_metadata = next(
-            (x for x in badge_metadata if x.get('name') == 'subscriber'), None)
-        if subscriber_badge and subscriber_badge_metadata:
-            subscriber_badge['months'] = int_or_none(
-                subscriber_badge_metadata['version'], 0)
+        if badges:
+            subscriber_index = next(
+                (i for i, x in enumerate(badges) if x.get('name') == 'subscriber'), None)
+            if subscriber_index is not None and badge_info:
+                months = TwitchChatDownloader._get_subscriber_months(
+                    badge_info)
+                if months is not None:
+                    # Badges are shared between messages, so modify a copy
+                    subscriber_badge = dict(badges[subscriber_index])
+                    subscriber_badge['months'] = months
+                    badges[subscriber_index] = subscriber_badge
+
+            author['badges'] = badges
 
         user_name_match = match.group(2)
         if user_name_match:
-            info['author_name'] = user_name_match.split('!')[0]
+            author['name'] = user_name_match.split('!')[0]
 
         # author_display_name = info.get('author_display_name')
         # if author_display_name:
             # info['author_name'] = author_display_name.lower()
 
-        in_reply_to = BaseChatDownloader._move_to_dict(info, 'in_reply_to')
-
-        BaseChatDownloader._move_to_dict(in_reply_to, 'author')
-        BaseChatDownloader._move_to_dict(info, 'author')
+        if in_reply_to_author:
+            in_reply_to['author'] = in_reply_to_author
+        if in_reply_to:
+            info['in_reply_to'] = in_reply_to
+        if author:
+            info['author'] = author
 
         original_action_type = match.group(3)
 
@@ -1504,145 +2537,96 @@ class TwitchChatDownloader(BaseChatDownloader):
         # :tmi.twitch.tv HOSTTARGET #gothamchess :anna_chess 6612
         return info
 
-    def _get_chat_messages_by_stream_id(self, stream_id, params):
-        max_attempts = params.get('max_attempts')
-
-        message_receive_timeout = params.get('message_receive_timeout')
-
-        buffer_size = params.get('buffer_size')
-
-        messages_groups_to_add = params.get('message_groups') or []
-        messages_types_to_add = params.get('message_types') or []
-
-        def create_connection():
-            for attempt_number in attempts(max_attempts):
-                try:
-                    irc = TwitchChatIRC()
-                    irc.set_timeout(message_receive_timeout)
-                    irc.join_channel(stream_id)
-                    return irc
-                except (socket.gaierror, ConnectionRefusedError) as e:
-                    self.retry(attempt_number, error=e, **params)
-
-        twitch_chat_irc = create_connection()
-
-        last_ping_time = time.time()
-
-        # TODO make this a param
-        ping_every = 60  # how often to ping the server
-
-        readbuffer = ''
-
-        message_count = 0
-
-        try:
-            while True:
-
-                try:
-                    new_info = twitch_chat_irc.recv(buffer_size)
-
-                    if not new_info:
-                        raise ConnectionError('Lost connection, reconnecting.')
-
-                    readbuffer += new_info
-
-                    if self._PING_TEXT in readbuffer:
-                        twitch_chat_irc.send_raw(self._PONG_TEXT)
-
-                    matches = list(self._MESSAGE_REGEX.finditer(readbuffer))
-                    full_readbuffer = readbuffer.endswith('\r\n')
-                    if matches:
-                        if not full_readbuffer:
-                            # sometimes a buffer does not contain a full message
-                            # last one is incomplete
-
-                            span = matches[-1].span()
-
-                            pass_on = readbuffer[span[0]:]
-
-                            # check whether message was cut off
-                            if '\r\n' in pass_on:  # last message not matched
-                                # only pass on incomplete message
-
-                                # readbuffer[span[1]:]
-                                pass_on = pass_on[span[1] - span[0]:]
+    @staticmethod
+    def _parse_irc_line(line):
+        match = TwitchChatDownloader._MESSAGE_REGEX.match(line)
+        if not match:
+            log('debug', f'No matches found in "{line}"')
+            return None
 
-                            # actual message cut off (matched, but not complete)
-                            else:
-                                # remove the last match from being processed (as it is incomplete)
-                                matches.pop()
+        data = TwitchChatDownloader._parse_irc_item(match)
 
-                            # pass remaining information to next attempt
-                            readbuffer = pass_on
+        # test for missing keys
+        missing_keys = data.keys() - TwitchChatDownloader._KNOWN_IRC_KEYS
 
-                        else:
-                            # the whole readbuffer was read correctly.
-                            # reset the readbuffer
-                            readbuffer = ''
+        if missing_keys:
+            debug_log(
+                f'Missing keys found: {missing_keys}',
+                f'Original data: {match.groups()}',
+                f'Parsed data: {data}'
+            )
 
-                        for match in matches:
+        target = match.group(4)
+        channel = target[1:] if target and target.startswith('#') else None
 
-                            data = self._parse_irc_item(match)
+        return channel, data
 
-                            # test for missing keys
-                            missing_keys = data.keys() - TwitchChatDownloader._KNOWN_IRC_KEYS
+    _irc_pool = None
 
-                            if missing_keys:
-                                debug_log(
-                                    f'Missing keys found: {missing_keys}',
-                                    f'Original data: {match.groups()}',
-                                    f'Parsed data: {data}'
-                                )
-                            # check whether to skip this message or not, based on its type
+    # Maximum number of received items waiting to be read by each chat
+    _SUBSCRIBER_QUEUE_SIZE = 10000
 
-                            to_add = self._must_add_item(
-                                data,
-                                self._MESSAGE_GROUPS,
-                                messages_groups_to_add,
-                                messages_types_to_add
-                            )
+    def _get_irc_pool(self, params):
+        # All livestreams share the same connection pool
+        if self._irc_pool is None:
+            self._irc_pool = TwitchChatIRCPool(
+                self._parse_irc_line, buffer_size=params.get('buffer_size'),
+                max_attempts=params.get('max_attempts'), retry_timeout=params.get('retry_timeout'))
+        return self._irc_pool
 
-                            if not to_add:
-                                continue
+    def _get_chat_messages_by_stream_ids(self, stream_ids, params, include_channel=False):
+        message_receive_timeout = params.get('message_receive_timeout')
 
-                            message_count += 1
-                            yield data
+        messages_groups_to_add = params.get('message_groups') or []
+        messages_types_to_add = params.get('message_types') or []
 
-                        log('debug',
-                            f'Total number of messages: {message_count}')
+        channels = [stream_id.lower() for stream_id in stream_ids]
 
-                    elif full_readbuffer:
-                        # No matches, but data has been read successfully.
-                        # This means that we can safely reset the readbuffer.
-                        # This is used to periodically reset the readbuffer,
-                        # to avoid a massive buffer from forming.
+        # Keep the badges of the channels while their chats are read
+        for channel in channels:
+            self._BADGE_CATALOG.pin(channel)
 
-                        # never pause
-                        log('debug',
-                            f'No matches found in "\n{readbuffer.strip()}\n"')
-                        readbuffer = ''
+        subscriber_queue = queue.Queue(self._SUBSCRIBER_QUEUE_SIZE)
+        irc_pool = self._get_irc_pool(params)
+        irc_pool.subscribe(channels, subscriber_queue)
 
-                    current_time = time.time()
+        try:
+            while True:
+                try:
+                    channel, data = subscriber_queue.get(
+                        timeout=message_receive_timeout)
+                except queue.Empty:
+                    yield {}
+                    continue
 
-                    time_since_last_ping = current_time - last_ping_time
+                if isinstance(data, Exception):  # Unable to continue
+                    raise data
 
-                    if time_since_last_ping > ping_every:
-                        twitch_chat_irc.send_raw('PING')
-                        last_ping_time = current_time
+                # check whether to skip this message or not, based on its type
+                to_add = self._must_add_item(
+                    data,
+                    self._MESSAGE_GROUPS,
+                    messages_groups_to_add,
+                    messages_types_to_add
+                )
 
-                except socket.timeout:
-                    yield {}
+                if not to_add:
+                    continue
 
-                except ConnectionError:
-                    # Close old connection
-                    twitch_chat_irc.close_connection()
+                if include_channel:
+                    # Items are shared between subscribers, so copy first
+                    data = {**data, 'channel': channel}
 
-                    # Create a new connection
-                    twitch_chat_irc = create_connection()
+                yield data
 
         finally:
-            log('info', 'Close Twitch IRC connection')
-            twitch_chat_irc.close_connection()
+            log('info', f'Leave Twitch IRC channel(s): {", ".join(channels)}')
+            irc_pool.unsubscribe(channels, subscriber_queue)
+            for channel in channels:
+                self._BADGE_CATALOG.unpin(channel)
+
+    def _get_chat_messages_by_stream_id(self, stream_id, params):
+        return self._get_chat_messages_by_stream_ids([stream_id], params)
 
     def _get_chat_by_stream_id(self, match, params):
         return self.get_chat_by_stream_id(match.group('id'), params)
@@ -1671,7 +2655,7 @@ class TwitchChatDownloader(BaseChatDownloader):
         title = multi_get(stream_info, 'lastBroadcast',
                           'title') if is_live else stream_id
 
-        self._update_badge_info(stream_id)
+        self._update_badge_info(stream_id, params)
 
         return Chat(
             self._get_chat_messages_by_stream_id(
@@ -1683,6 +2667,39 @@ class TwitchChatDownloader(BaseChatDownloader):
             id=stream_id
         )
 
+    def get_chat_by_stream_ids(self, stream_ids, params):
+        """Get a single chat containing the messages from multiple livestreams.
+        The channel each message was sent in is stored in its 'channel' key.
+
+        :param stream_ids: The names of the channels
+        :type stream_ids: list[str]
+        :return: Chat object containing messages from all channels
+        :rtype: Chat
+        """
+        for stream_id in stream_ids:
+            self._update_badge_info(stream_id, params)
+
+        return Chat(
+            self._get_chat_messages_by_stream_ids(
+                stream_ids, params, include_channel=True),
+            title=', '.join(stream_ids),
+            duration=None,
+            status='live',
+            video_type='video',
+            id=','.join(stream_ids)
+        )
+
+    def close(self):
+        """Close the session and all IRC connections."""
+        if self._gql_batcher is not None:
+            self._gql_batcher.close()
+            self._gql_batcher = None
+        if self._irc_pool is not None:
+            self._irc_pool.close()
+            self._irc_pool = None
+        self._BADGE_CATALOG.flush()
+        super().close()
+
     # # e.g. 'https://www.twitch.tv/spamfish/videos?filter=all'
     # _VALID_VIDEOS_URL = r'https?://(?:(?:www|go|m)\.)?twitch\.tv/(?P<id>[^/]+)/(?:videos|profile)'
 
@@ -40,17 +40,24 @@ from ..utils.core import (
     try_parse_json,
     regex_search,
     parse_iso8601,
-    get_title_of_webpage
+    get_title_of_webpage,
+    load_id_set
+)
+
+from ..utils.json_codec import (
+    json_loads,
+    JSONDecodeError
 )
 
 from ..debugging import (log, debug_log)
 
 from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 import re
 import hashlib
 from requests.exceptions import RequestException
-from json.decoder import JSONDecodeError
 from urllib import parse
 
 
@@ -1418,7 +1425,7 @@ class YouTubeChatDownloader(BaseChatDownloader):
         for attempt_number in attempts(max_attempts):
             try:
                 response = self._session_post(continuation_url, **post_kwargs)
-                json_response = response.json()
+                json_response = json_loads(response.content)
 
                 # Check for errors:
                 error = json_response.get('error')
@@ -2140,18 +2147,43 @@ class YouTubeChatDownloader(BaseChatDownloader):
 
         return chat_item
 
+    # For efficiency purposes, do not loop over all past broadcasts if not found
+    _MAX_VIDS_TO_TRY = 5
+
+    # Event which is set once probes made by the current thread are no longer
+    # needed (see `_get_chat_messages_by_user_args`)
+    _probe = threading.local()
+
+    def _check_probe(self):
+        stop = getattr(self._probe, 'stop', None)
+        if stop is not None and stop.is_set():
+            raise ChatDownloaderError('A livestream has already been selected')
+
+    def _session_get(self, url, **kwargs):
+        self._check_probe()
+        return super()._session_get(url, **kwargs)
+
+    def _session_post(self, url, **kwargs):
+        self._check_probe()
+        return super()._session_post(url, **kwargs)
+
+    def _probe_video(self, video_id, params, stop):
+        self._probe.stop = stop
+        try:
+            return self.get_chat_by_video_id(video_id, params)
+        finally:
+            self._probe.stop = None
+
     def _get_chat_messages_by_user_args(self, user_video_args, chat_item, params):
         # chat_item allows to change title and info based on new info
 
-        list_of_vids_to_ignore = params.get('ignore') or []
-
-        # For efficiency purposes, do not loop over all past broadcasts if not found
-        max_vids_to_try = 5
+        vids_to_ignore = load_id_set(params.get('ignore'))
 
         vids = self.get_user_videos(
             **user_video_args, video_type='live', params=params)
 
-        for video in islice(vids, max_vids_to_try):
+        candidates = []
+        for video in islice(vids, self._MAX_VIDS_TO_TRY):
             video_id = video['video_id']
             debug_log(video)
             if video['video_type'] != 'LIVE':
@@ -2159,27 +2191,53 @@ class YouTubeChatDownloader(BaseChatDownloader):
                     f'Skipping video with ID: "{video_id}" (not live)')
                 continue
 
-            if video_id in list_of_vids_to_ignore:
+            if video_id in vids_to_ignore:
                 log('debug', f'Skipping video with ID: "{video_id}"')
                 continue
 
-            try:
-                chat = self.get_chat_by_video_id(video_id, params)
+            candidates.append(video)
 
-                log('info',
-                    f"Found a livestream: \"{video['title']}\" ({video_id}).")
+        if not candidates:
+            return
 
-                for key, value in vars(chat).items():  # Update chat item
-                    if key != 'chat' and not key.startswith('_'):
-                        setattr(chat_item, key, value)
+        # Probe all candidates at the same time. The first candidate (in the
+        # order of the channel's videos) which succeeds is selected, and the
+        # remaining probes stop making requests.
+        chat = None
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        futures = [
+            executor.submit(self._probe_video, video['video_id'], params, stop)
+            for video in candidates
+        ]
+        try:
+            for video, future in zip(candidates, futures):
+                try:
+                    chat = future.result()
+                except ChatDownloaderError as e:
+                    # For some reason, doesn't work
+                    log('warning',
+                        f"Unable to get chat for \"{video['title']}\" ({video['video_id']}) due to an error: \"{e}\"")
+                    continue
 
-                yield from chat
+                log('info',
+                    f"Found a livestream: \"{video['title']}\" ({video['video_id']}).")
                 break
+        finally:
+            # Do not wait for probes which are no longer needed
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        if chat is None:
+            return
+
+        for key, value in vars(chat).items():  # Update chat item
+            if key != 'chat' and not key.startswith('_'):
+                setattr(chat_item, key, value)
 
-            except ChatDownloaderError as e:
-                # For some reason, doesn't work
-                log('warning',
-                    f"Unable to get chat for \"{video['title']}\" ({video_id}) due to an error: \"{e}\"")
+        yield from chat
 
     def get_chat_by_video_id(self, video_id, params):
         """Get chat messages for a YouTube video, given its ID.
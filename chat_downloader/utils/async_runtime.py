@@ -0,0 +1,230 @@
+"""A shared asyncio event loop which hosts live chat connections.
+
+The loop runs in a single background thread, so the number of threads stays
+the same no matter how many channels are being listened to. Connections are
+written as async generators (which async code can iterate over directly), and
+`AsyncRuntime.iterate` exposes them to synchronous code as regular generators.
+"""
+import asyncio
+import atexit
+import queue
+import threading
+
+from ..debugging import log
+
+
+class AsyncRuntime():
+    """An event loop running in a background (daemon) thread."""
+
+    # Maximum number of items waiting to be read by each iterator
+    _ITEM_QUEUE_SIZE = 10000
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._cleanups = []
+
+    @property
+    def loop(self):
+        """The event loop, which is started when first accessed.
+
+        :return: The event loop
+        :rtype: asyncio.AbstractEventLoop
+        """
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._loop,), daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _run(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            for cleanup in list(self._cleanups):
+                try:
+                    loop.run_until_complete(cleanup())
+                except Exception as e:
+                    log('debug', f'Unable to clean up the event loop: {e}')
+            loop.close()
+
+    def add_cleanup(self, cleanup):
+        """Register a coroutine function which is awaited before the event
+        loop is closed, e.g. to close connections shared by several tasks.
+
+        :param cleanup: The coroutine function, which takes no arguments
+        :type cleanup: function
+        """
+        with self._lock:
+            if cleanup not in self._cleanups:
+                self._cleanups.append(cleanup)
+
+    def in_runtime(self):
+        """Check whether the caller is running in the runtime's thread.
+
+        :return: True if called from the runtime's thread
+        :rtype: bool
+        """
+        return self._thread is threading.current_thread()
+
+    def submit(self, coro):
+        """Schedule a coroutine to run in the event loop.
+
+        :param coro: The coroutine
+        :type coro: coroutine
+        :return: A future which holds the result of the coroutine
+        :rtype: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine in the event loop and wait for its result.
+
+        :param coro: The coroutine
+        :type coro: coroutine
+        :param timeout: Maximum number of seconds to wait, defaults to None
+        :type timeout: float, optional
+        :raises RuntimeError: if called from the runtime's thread
+        :return: The result of the coroutine
+        :rtype: object
+        """
+        if self.in_runtime():
+            coro.close()
+            raise RuntimeError('Cannot block the event loop of the runtime')
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen, timeout=None, batched=False):
+        """Iterate over an async generator from synchronous code.
+
+        The generator is consumed in the event loop and its items are handed
+        over through a queue. If no item is received within `timeout` seconds,
+        an empty dictionary is yielded, so that the caller can check for
+        timeouts and interruptions. Closing the returned generator closes the
+        async generator. If the caller does not keep up, at most
+        `_ITEM_QUEUE_SIZE` items are buffered and newer items are dropped.
+
+        If `batched` is True, the async generator yields lists of items. Each
+        list is handed over in one operation, and its items are yielded one by
+        one.
+
+        :param agen: The async generator
+        :type agen: AsyncGenerator
+        :param timeout: Number of seconds to wait for an item before yielding
+            an empty dictionary, defaults to None (wait forever)
+        :type timeout: float, optional
+        :param batched: Whether the async generator yields lists of items,
+            defaults to False
+        :type batched: bool, optional
+        :raises Exception: any exception raised by the async generator
+        :return: The items of the async generator
+        :rtype: Generator
+        """
+        items = queue.Queue(self._ITEM_QUEUE_SIZE)
+        done = object()
+
+        def put(item, force=False):
+            try:
+                items.put_nowait(item)
+                return True
+            except queue.Full:
+                if not force:
+                    return False
+
+            # Make room for the final item, so that the caller always stops
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                pass
+            items.put_nowait(item)
+            return True
+
+        async def pump():
+            dropping = False
+            try:
+                async for item in agen:
+                    if put(item):
+                        dropping = False
+                    elif not dropping:
+                        dropping = True
+                        log('warning', 'Chat is not being read quickly enough, dropping messages.')
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                put((done, e), force=True)
+            else:
+                put((done, None), force=True)
+            finally:
+                await agen.aclose()
+
+        loop = self.loop
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    yield {}
+                    continue
+
+                if isinstance(item, tuple) and len(item) == 2 and item[0] is done:
+                    if item[1] is not None:
+                        raise item[1]
+                    return
+
+                if batched:
+                    yield from item
+                else:
+                    yield item
+        finally:
+            # Cancel from within the loop, so that the pump is always
+            # started (and its generator closed) before being cancelled.
+            # If the runtime has been stopped in the meantime, its tasks
+            # have already been cancelled, and a new loop must not be started.
+            if not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(future.cancel)
+                except RuntimeError:  # Closed since the check
+                    pass
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        """Cancel all running tasks and stop the event loop."""
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                if not self.in_runtime():
+                    asyncio.run_coroutine_threadsafe(
+                        self._cancel_tasks(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                if not self.in_runtime():
+                    self._thread.join()
+            self._loop = None
+            self._thread = None
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """Get the runtime shared by all chat downloaders.
+
+    :return: The shared runtime
+    :rtype: AsyncRuntime
+    """
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+            atexit.register(_runtime.stop)  # Run the cleanups
+        return _runtime
@@ -1,13 +1,18 @@
 import inspect
+import os
 import datetime
 import re
 import sys
 import locale
 import collections.abc
 import io
-import json
 import base64
 
+from .json_codec import (
+    json_loads,
+    JSONDecodeError
+)
+
 
 def base64_encode(text):
     return base64.b64encode(text.encode()).decode()
@@ -163,8 +168,8 @@ def try_get_first_value(dictionary, default=None):
 
 def try_parse_json(text, default=None):
     try:
-        return json.loads(text)
-    except (json.decoder.JSONDecodeError, TypeError):
+        return json_loads(text)
+    except (JSONDecodeError, TypeError):
         return default
 
 
@@ -181,6 +186,31 @@ def wrap_as_list(item):
     return item
 
 
+def load_id_set(items):
+    """Create a set of identifiers from a list of identifiers and/or files.
+
+    Items which are paths to existing files are replaced by the contents
+    of the file, with one identifier per line. Blank lines and lines
+    starting with '#' are skipped.
+
+    :param items: The identifiers (or file paths), defaults to None
+    :type items: Union[list, str, None]
+    :return: The set of identifiers
+    :rtype: set
+    """
+    id_set = set()
+    for item in wrap_as_list(items or []):
+        if os.path.isfile(item):
+            with open(item, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        id_set.add(line)
+        else:
+            id_set.add(item)
+    return id_set
+
+
 def remove_prefixes(text, prefixes):
     for prefix in wrap_as_list(prefixes):
         if text.startswith(prefix):
@@ -394,6 +424,26 @@ def chunks(lst, n):
         yield lst[i:i + n]
 
 
+class _Placeholder:
+    def __init__(self, name):
+        self.name = name
+
+    def __format__(self, format_spec):
+        return f'{{{self.name}:{format_spec}}}' if format_spec else f'{{{self.name}}}'
+
+
+class _PartialFields(dict):
+    def __missing__(self, key):
+        return _Placeholder(key)
+
+
+def partial_format(template, **fields):
+    """Format a string, keeping the replacement fields which are not given
+    (along with their format specifications) so that they can be filled in later.
+    """
+    return template.format_map(_PartialFields(fields))
+
+
 def safe_path(text, replace_char='_'):
     """Ensure generated file name/path is safe
     https://stackoverflow.com/a/31976060
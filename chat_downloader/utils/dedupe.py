@@ -0,0 +1,89 @@
+"""Removal of duplicate chat items.
+
+Duplicates arise when sites replay recent messages after a reconnect, or
+when consecutive requests return overlapping messages. Items are identified
+by their `message_id` or, if they have none, by a hash of their content.
+
+Only a bounded number of recent items are remembered: identifiers are kept in
+two generations of sets, and the older generation is discarded whenever the
+current one is full or a time window has passed. So, checking an item takes
+constant time and memory usage has a fixed ceiling.
+"""
+import time
+
+from .json_codec import json_dumpb
+
+
+class Deduplicator:
+    """Filter which drops chat items that have recently been seen."""
+
+    def __init__(self, window=600, max_size=100000):
+        """Create a Deduplicator object.
+
+        :param window: Number of seconds after which a generation of
+            identifiers is replaced, defaults to 600. Items are remembered
+            for at least this long, unless `max_size` is reached first.
+            If None, generations are only replaced when full.
+        :type window: float, optional
+        :param max_size: Maximum number of identifiers to remember, defaults
+            to 100000
+        :type max_size: int, optional
+        """
+        self.window = window
+        self.generation_size = max(max_size // 2, 1)
+
+        self._current = set()
+        self._previous = set()
+        self._generation_start = time.monotonic()
+
+    @staticmethod
+    def get_key(item):
+        """Get the identifier of a chat item.
+
+        :param item: The chat item
+        :type item: dict
+        :return: The hash of the item's message id or, if it has none, of
+            its content
+        :rtype: int
+        """
+        message_id = item.get('message_id')
+        if message_id is not None:
+            return hash(('id', message_id))
+        return hash(('content', json_dumpb(item, sort_keys=True)))
+
+    def is_duplicate(self, item):
+        """Check whether a chat item has recently been seen, and remember it
+        if it has not.
+
+        :param item: The chat item
+        :type item: dict
+        :return: True if the item is a duplicate
+        :rtype: bool
+        """
+        key = self.get_key(item)
+        if key in self._current or key in self._previous:
+            return True
+
+        now = time.monotonic()
+        if len(self._current) >= self.generation_size or (
+                self.window is not None and now - self._generation_start >= self.window):
+            self._previous = self._current
+            self._current = set()
+            self._generation_start = now
+
+        self._current.add(key)
+        return False
+
+    def filter(self, items):
+        """Remove duplicates from an iterable of chat items. Empty items
+        (used by live chats to signal that there are no new messages) are
+        passed through.
+
+        :param items: The chat items
+        :type items: Iterable
+        :return: The chat items, without duplicates
+        :rtype: Generator
+        """
+        for item in items:
+            if not item or not self.is_duplicate(item):
+                yield item
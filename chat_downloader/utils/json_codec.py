@@ -0,0 +1,120 @@
+"""JSON encoding and decoding used throughout the package.
+
+orjson is used whenever it can produce the requested output. It only indents
+by 2 spaces, so other indents (such as the default of the JSON writer, 4) are
+produced by replacing the indentation of its output. The standard library is
+used as a fallback for objects that orjson is unable to serialise, and for
+documents which may contain integers larger than 64 bits (which orjson would
+decode as floats).
+"""
+import json
+import re
+
+import orjson
+
+
+JSONDecodeError = json.JSONDecodeError
+
+# Integers with this many digits may not fit in 64 bits
+_LONG_NUMBER = re.compile(rb'\d{19}')
+_LONG_NUMBER_TEXT = re.compile(r'\d{19}')
+
+
+def json_loads(data):
+    """Decode a JSON document.
+
+    :param data: The JSON document
+    :type data: Union[bytes, bytearray, memoryview, str]
+    :raises JSONDecodeError: if the document is not valid JSON (or not a
+        string or bytes-like object)
+    :return: The decoded object
+    :rtype: object
+    """
+    if isinstance(data, str):
+        long_number = _LONG_NUMBER_TEXT.search(data)
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        long_number = _LONG_NUMBER.search(data)
+    else:
+        long_number = None  # orjson raises a JSONDecodeError
+
+    if long_number is None:
+        return orjson.loads(data)
+
+    if not isinstance(data, str):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def _orjson_dumpb(obj, sort_keys, indent):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent is None:
+        return orjson.dumps(obj, option=option)
+
+    data = orjson.dumps(obj, option=option | orjson.OPT_INDENT_2)
+    if indent == 2:
+        return data
+
+    padding = (' ' * indent if isinstance(indent, int) else indent).encode('utf-8')
+    return _reindent(data, padding)
+
+
+def _reindent(data, padding):
+    # Replace each level of 2 space indentation by `padding`. The output of
+    # orjson cannot contain raw control characters (nor newlines in strings),
+    # so they can be used to mark the indentation. A marker is placed at the
+    # start of each line, and moved past one level of indentation at a time.
+    data = data.replace(b'\n', b'\n\x01')
+    while b'\x01  ' in data:
+        data = data.replace(b'\x01  ', b'\x00\x01')
+    return data.replace(b'\x01', b'').replace(b'\x00', padding)
+
+
+def _stdlib_dumps(obj, sort_keys, indent):
+    # Match orjson's compact separators when not indenting
+    separators = (',', ':') if indent is None else None
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys,
+                      indent=indent, separators=separators)
+
+
+def json_dumpb(obj, sort_keys=False, indent=None):
+    """Encode an object as UTF-8 JSON bytes.
+
+    :param obj: The object to encode
+    :type obj: object
+    :param sort_keys: Whether to sort the keys of dictionaries, defaults to False
+    :type sort_keys: bool, optional
+    :param indent: Number of spaces (or the string) to indent by, defaults
+        to None (compact output)
+    :type indent: Union[int, str], optional
+    :return: The encoded object
+    :rtype: bytes
+    """
+    try:
+        return _orjson_dumpb(obj, sort_keys, indent)
+    except orjson.JSONEncodeError:
+        pass  # Fall back to the standard library
+
+    return _stdlib_dumps(obj, sort_keys, indent).encode('utf-8')
+
+
+def json_dumps(obj, sort_keys=False, indent=None):
+    """Encode an object as a JSON string.
+
+    :param obj: The object to encode
+    :type obj: object
+    :param sort_keys: Whether to sort the keys of dictionaries, defaults to False
+    :type sort_keys: bool, optional
+    :param indent: Number of spaces (or the string) to indent by, defaults
+        to None (compact output)
+    :type indent: Union[int, str], optional
+    :return: The encoded object
+    :rtype: str
+    """
+    try:
+        return _orjson_dumpb(obj, sort_keys, indent).decode('utf-8')
+    except orjson.JSONEncodeError:
+        pass  # Fall back to the standard library
+
+    return _stdlib_dumps(obj, sort_keys, indent)
@@ -20,7 +20,6 @@ requirements = [
     'isodate',
     'docstring-parser',
     'colorlog',
-    'websocket-client',
     'aiohttp',
     'orjson',
     'typing_extensions',
@@ -53,6 +52,9 @@ setup(
     },
     install_requires=requirements,
     extras_require={
+        'parquet': [
+            'pyarrow'
+        ],
         'dev': [
             'flake8',
             'twine',
@@ -8,7 +8,32 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from chat_downloader import ChatDownloader
 from chat_downloader.sites import YouTubeChatDownloader
+from chat_downloader.sites.twitch import (
+    IRCLineFramer,
+    GQLBatcher,
+    TwitchBadgeCatalog,
+    TwitchChatDownloader,
+    TwitchChatIRC,
+    TwitchChatIRCPool
+)
+from chat_downloader.errors import RetriesExceeded, ChatDownloaderError
+from chat_downloader.sites.common import Chat
+from chat_downloader.sites.afreeca.constants import FLAG, ServiceCode
+from chat_downloader.sites.afreeca.packet import create_packet, decode_packet
+from chat_downloader.sites.afreeca.utils import Flag, get_flag_mask, get_flags
+from chat_downloader.sites.afreeca.credential import UserCredential
+from chat_downloader.sites.afreeca.exceptions import LoginError
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 import itertools
+import asyncio
+import copy
+import base64
+import tempfile
+import time
+import queue
+import socket
+import threading
 
 
 class TestSites(unittest.TestCase):
@@ -16,6 +41,340 @@ class TestSites(unittest.TestCase):
     Class used to run unit tests for writers.
     """
 
+    def test_twitch_irc_framing(self):
+        data = 'PING :tmi.twitch.tv\r\n@a=1 :x PRIVMSG #y :caf\u00e9 \U0001F600\r\n'.encode()
+
+        # Split the data at every possible position
+        for i in range(len(data) + 1):
+            framer = IRCLineFramer()
+            lines = framer.feed(data[:i]) + framer.feed(data[i:])
+            self.assertEqual(lines, [
+                'PING :tmi.twitch.tv',
+                '@a=1 :x PRIVMSG #y :caf\u00e9 \U0001F600'
+            ])
+
+        framer = IRCLineFramer()
+        self.assertEqual(framer.feed(b'incomplete'), [])
+        self.assertEqual(framer.feed(b' line\r\nnext'), ['incomplete line'])
+        self.assertEqual(framer.feed(b'\r\n'), ['next'])
+
+    def test_twitch_irc_pool(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        port = server.getsockname()[1]
+        finished = threading.Event()
+
+        def serve():
+            # The first connection is closed after sending its messages
+            for messages, keep_open in (([b'bad', b'first'], False), ([b'second'], True)):
+                connection, _ = server.accept()
+                with connection:
+                    data = b''
+                    while b'JOIN #test\r\n' not in data:
+                        data += connection.recv(4096)
+                    for message in messages:
+                        connection.sendall(b':x PRIVMSG #test :' + message + b'\r\n')
+                    if keep_open:
+                        finished.wait()
+
+        def parse_line(line):
+            channel, _, message = line.partition(' PRIVMSG #')[2].partition(' :')
+            if message == 'bad':
+                raise ValueError('Unable to parse line')
+            return channel, {'message': message}
+
+        server_thread = threading.Thread(target=serve, daemon=True)
+        server_thread.start()
+
+        with mock.patch.object(TwitchChatIRC, '_HOST', '127.0.0.1'), \
+                mock.patch.object(TwitchChatIRC, '_PORT', port):
+            pool = TwitchChatIRCPool(parse_line, max_attempts=2, retry_timeout=0)
+            subscriber_queue = queue.Queue()
+            full_queue = queue.Queue(1)
+            pool.subscribe(['test'], subscriber_queue)
+            pool.subscribe(['Test'], full_queue)
+
+            # Lines which cannot be parsed are skipped, and channels are
+            # rejoined when the connection drops
+            first = subscriber_queue.get(timeout=5)
+            self.assertEqual(first, ('test', {'message': 'first'}))
+            self.assertEqual(subscriber_queue.get(timeout=5), ('test', {'message': 'second'}))
+
+            # Items are dropped rather than waiting for full queues, and
+            # each subscriber receives its own copy
+            copied = full_queue.get_nowait()
+            self.assertEqual(copied, first)
+            self.assertIsNot(copied[1], first[1])
+            self.assertTrue(full_queue.empty())
+
+            # The thread stops once there are no subscribers
+            thread = pool._thread
+            pool.unsubscribe(['test'], subscriber_queue)
+            pool.unsubscribe(['test'], full_queue)
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(pool._connections(), [])
+
+            # Subscribers receive an error once connecting fails too often
+            server.close()
+            finished.set()
+            server_thread.join()
+
+            failed_queue = queue.Queue()
+            pool.subscribe(['other'], failed_queue)
+            channel, error = failed_queue.get(timeout=5)
+            self.assertEqual(channel, 'other')
+            self.assertIsInstance(error, RetriesExceeded)
+            pool.close()
+
+    def test_twitch_gql_batching(self):
+        batch_sizes = []
+
+        def post(ops):
+            batch_sizes.append(len(ops))
+            return [op['variables'] for op in ops]
+
+        batcher = GQLBatcher(post, max_batch_size=10)
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            results = list(executor.map(
+                lambda i: batcher.request([{'variables': i}, {'variables': -i}]), range(200)))
+        batcher.close()
+
+        self.assertEqual(results, [[i, -i] for i in range(200)])
+        self.assertEqual(sum(batch_sizes), 400)
+        self.assertLessEqual(max(batch_sizes), 10)
+
+    def test_twitch_vod_segments(self):
+        duration = 12 * 60 * 60
+        requests = []
+
+        def download_gql(ops):
+            # A comment every 10 seconds, 10 comments per page
+            variables = ops[0]['variables']
+            requests.append(variables)
+            start = int(variables.get('cursor') or variables['contentOffsetSeconds'])
+            start -= start % 10
+            offsets = range(start, min(start + 100, duration), 10)
+            return [{'data': {'video': {'comments': {
+                'edges': [{
+                    'cursor': str(offset + 10),
+                    'node': {'id': str(offset), 'contentOffsetSeconds': offset}
+                } for offset in offsets],
+                'pageInfo': {'hasNextPage': start + 100 < duration}
+            }}}}]
+
+        downloader = TwitchChatDownloader()
+        downloader._download_gql = download_gql
+
+        def messages(end_time, max_concurrent_segments):
+            requests.clear()
+            params = {
+                'start_time': 0,
+                'end_time': end_time,
+                'message_groups': ['all'],
+                'max_concurrent_segments': max_concurrent_segments,
+                'max_attempts': 1
+            }
+            return [message['time_in_seconds'] for message in
+                    downloader._get_chat_messages_by_vod_id('1', params, duration)]
+
+        self.assertEqual(messages(60, 4), list(range(0, 61, 10)))
+        self.assertEqual(len(requests), 1)
+
+        sequential = messages(1500, 1)
+        sequential_requests = len(requests)
+        self.assertEqual(sequential, list(range(0, 1501, 10)))
+
+        # Segments only overlap by a request each
+        self.assertEqual(messages(1500, 4), sequential)
+        self.assertLessEqual(len(requests), sequential_requests + 2)
+
+        # Items of the first segment are yielded while later segments
+        # download, and no more requests are made once the chat is closed
+        def slow_download_gql(ops):
+            time.sleep(0.01)
+            return download_gql(ops)
+
+        downloader._download_gql = slow_download_gql
+        requests.clear()
+        chat = downloader._get_chat_messages_by_vod_id('1', {
+            'message_groups': ['all'], 'max_concurrent_segments': 4, 'max_attempts': 1}, duration)
+        self.assertEqual(next(chat)['time_in_seconds'], 0)
+        chat.close()
+        time.sleep(0.3)
+        self.assertLessEqual(len(requests), 8)
+
+    def test_twitch_badge_catalog(self):
+        def badge(set_id, version, channel_id=''):
+            badge_id = base64.b64encode(f'{set_id};{version};{channel_id}'.encode())
+            return {'id': badge_id.decode(), 'title': f'{set_id} {channel_id}'.strip()}
+
+        global_badges = [badge('subscriber', '0')]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'badges.json')
+            catalog = TwitchBadgeCatalog(max_channels=2, path=path)
+
+            for channel_id in ('1', '2', '3'):
+                catalog.update(f'channel_{channel_id}', global_badges, [
+                    badge('subscriber', '0', channel_id)])
+
+            # The least recently used channel is evicted
+            self.assertFalse(catalog.is_fresh('channel_1'))
+            self.assertTrue(catalog.is_fresh('channel_3'))
+            self.assertEqual(catalog.get('subscriber', '0', 1)['title'], 'subscriber')
+            self.assertEqual(catalog.get('subscriber', '0', 3)['title'], 'subscriber 3')
+
+            # Pinned channels are not evicted (whatever their case)
+            catalog.pin('Channel_2')
+            catalog.update('channel_4', global_badges, [badge('subscriber', '0', '4')])
+            catalog.update('CHANNEL_5', global_badges, [badge('subscriber', '0', '5')])
+            self.assertTrue(catalog.is_fresh('channel_2'))
+            self.assertTrue(catalog.is_fresh('Channel_5'))
+            self.assertFalse(catalog.is_fresh('channel_3'))
+            self.assertFalse(catalog.is_fresh('channel_4'))
+            catalog.unpin('CHANNEL_2')
+
+            # Updates are saved at most once per interval, and when flushed
+            with open(path, 'rb') as f:
+                self.assertNotIn(b'channel_2', f.read())
+            catalog.flush()
+
+            # Fresh channels are loaded from disk
+            loaded = TwitchBadgeCatalog(path=path)
+            self.assertTrue(loaded.is_fresh('channel_2'))
+            self.assertEqual(loaded.get('subscriber', '0', '2')['title'], 'subscriber 2')
+            self.assertIsNone(loaded.get('moderator', '1'))
+
+    def test_twitch_shared_objects(self):
+        # Badges and emotes are shared between messages
+        line = '@badges=moderator/1;emotes=25:0-4 :user!user@user.tmi.twitch.tv PRIVMSG #channel :Kappa hi'
+        first = TwitchChatDownloader._parse_irc_line(line)[1]
+        second = TwitchChatDownloader._parse_irc_line(line)[1]
+        self.assertIs(first['author']['badges'][0], second['author']['badges'][0])
+        self.assertIs(first['emotes'][0]['images'], second['emotes'][0]['images'])
+
+        # Copies can be modified without affecting others
+        badge = TwitchChatDownloader._parse_badge_info('subscriber', '0', copy=True)
+        expected = copy.deepcopy(badge)
+        badge['months'] = 3
+        badge['name'] = 'changed'
+        self.assertEqual(TwitchChatDownloader._parse_badge_info('subscriber', '0'), expected)
+
+        images = TwitchChatDownloader._generate_emote_image_list('25', copy=True)
+        expected = copy.deepcopy(images)
+        images[0]['url'] = 'changed'
+        images.pop()
+        self.assertEqual(TwitchChatDownloader._generate_emote_image_list('25'), expected)
+
+        # Subscriber months are added to a copy of the shared badge
+        line = '@badge-info=subscriber/5;badges=subscriber/0 :user!user@user.tmi.twitch.tv PRIVMSG #channel :hi'
+        badge = TwitchChatDownloader._parse_irc_line(line)[1]['author']['badges'][0]
+        self.assertEqual(badge['months'], 5)
+        self.assertNotIn('months', TwitchChatDownloader._parse_badge_info('subscriber', '0'))
+
+    def test_youtube_livestream_probes(self):
+        youtube = YouTubeChatDownloader()
+        requests = []
+        youtube.session.get = lambda url, **kwargs: requests.append(url)
+        probe_errors = []
+
+        def get_chat_by_video_id(video_id, params):
+            if video_id == 'not_live':
+                raise ChatDownloaderError('Not live')
+
+            # The first live video in the channel's order responds last
+            time.sleep({'first': 0.2, 'second': 0.05, 'third': 0.4}[video_id])
+            try:
+                youtube._session_get(video_id)
+            except ChatDownloaderError as e:
+                probe_errors.append(video_id)
+                raise e
+            return Chat(iter([{'message': video_id}]), title=video_id, id=video_id)
+
+        youtube.get_chat_by_video_id = get_chat_by_video_id
+        youtube.get_user_videos = lambda **kwargs: iter([
+            {'video_id': video_id, 'title': video_id, 'video_type': 'LIVE'}
+            for video_id in ('not_live', 'first', 'second', 'third')
+        ])
+
+        chat_item = Chat()
+        messages = list(youtube._get_chat_messages_by_user_args({}, chat_item, {}))
+        self.assertEqual(messages, [{'message': 'first'}])
+        self.assertEqual(chat_item.id, 'first')
+
+        # Probes which are still running stop making requests
+        time.sleep(0.4)
+        self.assertEqual(requests, ['second', 'first'])
+        self.assertEqual(probe_errors, ['third'])
+
+    def test_afreeca_packets(self):
+        fields = ['안녕 GG', 'user1', '0', '', '닉네임']
+        packet = create_packet(ServiceCode.SVC_CHATMESG, fields)
+        self.assertEqual(decode_packet(packet), (ServiceCode.SVC_CHATMESG, 0, fields))
+
+        # A field which is not UTF-8 is decoded as EUC-KR, without affecting
+        # the others
+        packet = packet.replace('닉네임'.encode('utf-8'), '닉네임'.encode('euc-kr'))
+        self.assertEqual(decode_packet(packet), (ServiceCode.SVC_CHATMESG, 0, fields))
+
+        self.assertEqual(decode_packet(create_packet(ServiceCode.SVC_KEEPALIVE, [])),
+                         (ServiceCode.SVC_KEEPALIVE, 0, ['']))
+        self.assertRaises(ValueError, decode_packet, packet[:10])
+
+    def test_afreeca_flags(self):
+        flag = Flag().add(FLAG['ADMIN']).add(FLAG['MOBILE_WEB']).add(FLAG['CLAN'])
+        self.assertEqual((flag.flag1, flag.flag2), (str(1 | 1 << 23), '2'))
+
+        # Flags are listed in the order of FLAG, and cached
+        self.assertEqual(get_flags(flag.flag1, flag.flag2), ('MOBILE_WEB', 'ADMIN', 'CLAN'))
+        self.assertIs(get_flags(flag.flag1, flag.flag2), get_flags(flag.flag1, flag.flag2))
+        self.assertEqual(get_flags('0', '0'), ())
+
+        # flag2 is held in the upper 32 bits of the mask
+        self.assertEqual(get_flag_mask(flag.flag1, flag.flag2), 1 | 1 << 23 | 2 << 32)
+        self.assertEqual(get_flag_mask(str(1 << 31), '0'), 1 << 31)
+        self.assertEqual(get_flag_mask('0', '1'), 1 << 32)
+
+    def test_afreeca_credential_cache(self):
+        logins = []
+
+        async def login(id, pw):
+            logins.append(id)
+            await asyncio.sleep(0.01)
+            if id == 'wrong':
+                raise LoginError()
+            return UserCredential()
+
+        async def get_credentials():
+            # Concurrent logins of the same account share one task
+            first, second, other = await asyncio.gather(
+                UserCredential.get('a', 'pw'), UserCredential.get('a', 'pw'),
+                UserCredential.get('b', 'pw'))
+            task = UserCredential._cache[('a', 'pw')][1]
+            later = await UserCredential.get('a', 'pw')
+            self.assertIs(UserCredential._cache[('a', 'pw')][1], task)
+
+            # Failed logins are not reused
+            for _ in range(2):
+                with self.assertRaises(LoginError):
+                    await UserCredential.get('wrong', 'pw')
+
+            return first, second, other, later
+
+        with mock.patch.object(UserCredential, '_cache', {}), \
+                mock.patch.object(UserCredential, 'login', side_effect=login):
+            first, second, other, later = asyncio.run(get_credentials())
+
+            self.assertIs(first, second)
+            self.assertIs(first, later)
+            self.assertIsNot(first, other)
+            self.assertEqual(logins, ['a', 'b', 'wrong', 'wrong'])
+
+            # Logins are not shared between event loops
+            self.assertIsNot(asyncio.run(UserCredential.get('a', 'pw')), first)
+
     def test_youtube(self):
 
         max_videos = 50
@@ -1,6 +1,11 @@
 import os
+import json
 import sys
 import unittest
+import tempfile
+import threading
+import asyncio
+import time
 
 # Allow direct execution
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
@@ -8,9 +13,18 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from chat_downloader.utils.core import (
     safe_print,
-    get_title_of_webpage
+    get_title_of_webpage,
+    load_id_set
+)
+from chat_downloader.utils.json_codec import (
+    json_loads,
+    json_dumps,
+    json_dumpb,
+    JSONDecodeError
 )
 from chat_downloader.utils.timed_utils import timed_input
+from chat_downloader.utils.async_runtime import AsyncRuntime
+from chat_downloader.utils.dedupe import Deduplicator
 
 
 class TestUtils(unittest.TestCase):
@@ -29,6 +43,124 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(get_title_of_webpage(
             'a <title>title</title> b'), 'title')
 
+    def test_load_id_set(self):
+        self.assertEqual(load_id_set(None), set())
+        self.assertEqual(load_id_set(['a', 'b', 'a']), {'a', 'b'})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ignore.txt')
+            with open(path, 'w') as f:
+                f.write('# comment\nc\n\nd\n')
+            self.assertEqual(load_id_set(['a', path]), {'a', 'c', 'd'})
+
+    def test_json_codec(self):
+        item = {'b': [1, {'c': '\u00e9'}], 'a': None}
+        self.assertEqual(json_dumps(item, sort_keys=True),
+                         '{"a":null,"b":[1,{"c":"\u00e9"}]}')
+        self.assertEqual(json_loads(json_dumpb(item)), item)
+
+        # Fallbacks to the standard library
+        self.assertEqual(json_dumps({'a': 2**70}), '{"a":%d}' % 2**70)
+        self.assertEqual(json_loads('{"a": %d}' % 2**70), {'a': 2**70})
+        self.assertEqual(json_loads(b'[-%d]' % 2**64), [-2**64])
+
+        for invalid in ('{"a": 1', b'', None, 1):
+            self.assertRaises(JSONDecodeError, json_loads, invalid)
+
+        # Other indents match the standard library
+        item = {'b': [1, {'c': '\u00e9 \n  x', 'd': []}], 'a': {}}
+        for indent in (0, 3, 4, '\t'):
+            self.assertEqual(json_dumps(item, indent=indent),
+                             json.dumps(item, indent=indent, ensure_ascii=False))
+
+    def test_async_runtime(self):
+        runtime = AsyncRuntime()
+
+        async def count(n):
+            for i in range(n):
+                await asyncio.sleep(0)
+                yield i
+
+        async def fail():
+            yield 1
+            raise ValueError
+
+        self.assertEqual(runtime.run(asyncio.sleep(0, 'done')), 'done')
+        self.assertEqual(list(runtime.iterate(count(3))), [0, 1, 2])
+
+        async def batches():
+            yield [0, 1]
+            yield [2]
+
+        self.assertEqual(list(runtime.iterate(batches(), batched=True)), [0, 1, 2])
+
+        items = runtime.iterate(fail())
+        self.assertEqual(next(items), 1)
+        self.assertRaises(ValueError, next, items)
+
+        # Yield empty dictionaries while waiting for items
+        items = runtime.iterate(count(10**9), timeout=0)
+        self.assertIn(next(items), ({}, 0))
+        items.close()
+
+        # At most _ITEM_QUEUE_SIZE items are buffered, but the end is always
+        # delivered
+        started = threading.Event()
+
+        async def burst(n):
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            for i in range(n):
+                yield i
+
+        runtime._ITEM_QUEUE_SIZE = 2
+        items = runtime.iterate(burst(5), timeout=0)
+        self.assertEqual(next(items), {})
+        started.set()
+        time.sleep(0.5)
+        self.assertEqual(list(items), [1])
+        del runtime._ITEM_QUEUE_SIZE
+
+        # Closing an iterator after the runtime has been stopped does not
+        # start a new event loop
+        items = runtime.iterate(count(10**9), timeout=0)
+        next(items)
+        runtime.stop()
+        items.close()
+        self.assertIsNone(runtime._loop)
+
+        # Cleanups run in the event loop before it is closed
+        cleaned_up = []
+
+        async def cleanup():
+            cleaned_up.append(asyncio.get_running_loop())
+
+        loop = runtime.loop
+        runtime.add_cleanup(cleanup)
+        runtime.stop()
+        self.assertEqual(cleaned_up, [loop])
+        self.assertTrue(loop.is_closed())
+
+    def test_deduplicator(self):
+        items = [
+            {'message_id': 'a', 'message': 'hi'},
+            {},
+            {'message_id': 'a', 'message': 'hi (edited)'},  # Same id
+            {'message': 'no id'},
+            {'message': 'no id'},  # Same content
+            {},
+            {'message_id': 'b'}
+        ]
+        self.assertEqual(list(Deduplicator().filter(items)), [
+            items[0], {}, items[3], {}, items[6]])
+
+        # Only the two most recent generations are remembered
+        deduplicator = Deduplicator(window=None, max_size=4)
+        for i in range(6):
+            self.assertFalse(deduplicator.is_duplicate({'message_id': i}))
+        self.assertTrue(deduplicator.is_duplicate({'message_id': 5}))
+        self.assertFalse(deduplicator.is_duplicate({'message_id': 0}))
+
     def test_timed_input(self):
         if os.name == 'nt':  # only test on windows
             self.assertEqual(timed_input(5, 'Enter:'), None)
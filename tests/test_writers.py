@@ -1,14 +1,25 @@
 import os
 import sys
+import json
+import gzip
+import importlib.util
+import sqlite3
 import unittest
 import tempfile
+import time
 
 # Allow direct execution
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # noqa
 
 
 from chat_downloader import ChatDownloader
-from chat_downloader.output.continuous_write import ContinuousWriter
+from chat_downloader.output.continuous_write import (
+    ContinuousWriter,
+    MultiWriter,
+    SharedItem
+)
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
 
 
 class TestWriters(unittest.TestCase):
@@ -29,6 +40,9 @@ class TestWriters(unittest.TestCase):
             for index, test_url in enumerate(test_urls):
                 # Test types of writers
                 for extension in ContinuousWriter._SUPPORTED_WRITERS:
+                    if extension == 'parquet' and not HAS_PYARROW:
+                        continue  # Optional dependency
+
                     path = os.path.join(tmp, f'test_{index}.{extension}')
 
                     chat = list(downloader.get_chat(
@@ -53,3 +67,235 @@ class TestWriters(unittest.TestCase):
 
                     self.assertTrue(os.path.exists(
                         chat._output_writer.file_name))
+
+    def test_csv_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.csv')
+
+            with ContinuousWriter(path) as writer:
+                writer.write({'b': 1, 'author': {'name': 'x'}})
+                writer.write({'a': 'y'})
+
+            # Appending with a new column rewrites the header once
+            with ContinuousWriter(path, overwrite=False) as writer:
+                writer.write({'c': 2})
+
+            with open(path, newline='', encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), [
+                    'a,author.name,b,c', ',x,1,', 'y,,,', ',,,2'])
+            self.assertEqual(os.listdir(tmp), ['test.csv'])
+
+            # Declared columns are written as items arrive
+            with ContinuousWriter(path, columns=['b', 'a']) as writer:
+                writer.write({'a': 1, 'z': 2}, flush=True)
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(f.read().splitlines(), ['b,a', ',1'])
+
+    def test_json_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.json')
+            with ContinuousWriter(path, indent=4) as writer:
+                writer.write({'a': 1}, flush=True)
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(json.load(f), [{'a': 1}])
+                writer.write({'b': 2})
+
+            # Existing items are kept as they are
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n\n')
+            with ContinuousWriter(path, overwrite=False) as writer:
+                writer.write({'c': 3})
+
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f), [{'a': 1}, {'b': 2}, {'c': 3}])
+
+    def test_json_writer_unclosed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for indent in (None, 4):
+                path = os.path.join(tmp, f'test{indent}.json')
+                with ContinuousWriter(path, indent=indent) as writer:
+                    writer.write({'a': 1})
+                    writer.write({'b': {'c': [1, 2]}})
+
+                # The program stopped before the closing bracket was written
+                with open(path, 'rb+') as f:
+                    data = f.read().rstrip()
+                    f.seek(0)
+                    f.truncate()
+                    f.write(data[:-1])
+
+                with ContinuousWriter(path, indent=indent, overwrite=False) as writer:
+                    writer.write({'d': 4})
+
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(json.load(f), [
+                        {'a': 1}, {'b': {'c': [1, 2]}}, {'d': 4}])
+
+            # Existing data is never discarded
+            path = os.path.join(tmp, 'test.json')
+            for data in ('not json', '[{"a": 1}, {"b": ', '{"a": 1}'):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                with self.assertRaises(ValueError):
+                    ContinuousWriter(path, overwrite=False)
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_flush_policy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.jsonl')
+
+            def written():
+                with open(path, encoding='utf-8') as f:
+                    return len(f.readlines())
+
+            with ContinuousWriter(path, flush_every=3) as writer:
+                for i in range(5):
+                    writer.write({'i': i})
+                self.assertEqual(written(), 3)
+
+                writer.idle()
+                self.assertEqual(written(), 5)
+
+            # All queued items are written when closing
+            with ContinuousWriter(path, overwrite=False, background=True, queue_size=2) as writer:
+                for i in range(100):
+                    writer.write({'i': i})
+            self.assertEqual(written(), 105)
+
+    def test_compressed_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.jsonl.gz')
+            with ContinuousWriter(path, compression_level=1) as writer:
+                writer.write({'a': 1})
+
+            # Appending adds a new gzip member
+            with ContinuousWriter(path, overwrite=False) as writer:
+                writer.write({'b': 2})
+
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                self.assertEqual([json.loads(line) for line in f],
+                                 [{'a': 1}, {'b': 2}])
+
+            with self.assertRaises(ValueError):
+                ContinuousWriter(os.path.join(tmp, 'test.json.gz'))
+
+    @unittest.skipIf(not HAS_PYARROW, 'pyarrow is not installed')
+    def test_parquet_writer(self):
+        import pyarrow.parquet
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.parquet')
+            with ContinuousWriter(path, row_group_size=2) as writer:
+                writer.write({'a': 1, 'author': {'name': 'x'}})
+                writer.write({'a': 2})
+                writer.write({'a': 2.5, 'b': 'y'})  # New column and type
+
+            # Appending combines the existing rows with the new ones
+            with ContinuousWriter(path, overwrite=False) as writer:
+                writer.write({'c': True})
+
+            table = pyarrow.parquet.read_table(path)
+            self.assertEqual(table.column_names, ['a', 'author.name', 'b', 'c'])
+            self.assertEqual(table.column('a').to_pylist(), [1, 2, 2.5, None])
+            self.assertEqual(pyarrow.parquet.ParquetFile(path).num_row_groups, 3)
+            self.assertEqual(os.listdir(tmp), ['test.parquet'])
+
+            # No file is left behind if nothing is written
+            empty_path = os.path.join(tmp, 'empty.parquet')
+            ContinuousWriter(empty_path, row_group_size=2).close()
+            self.assertFalse(os.path.exists(empty_path))
+
+    def test_sqlite_writer(self):
+        def message(index):
+            return {
+                'message_id': str(index),
+                'message': f'message {index}',
+                'timestamp': index,
+                'author': {'id': str(index % 2), 'name': f'name {index}'},
+                'is_moderator': False
+            }
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.db')
+            with ContinuousWriter(path, batch_size=2) as writer:
+                for index in range(3):
+                    writer.write(message(index))
+
+            # Messages which were already written are skipped
+            with ContinuousWriter(path, overwrite=False) as writer:
+                for index in range(1, 5):
+                    writer.write(message(index))
+
+            connection = sqlite3.connect(path)
+            self.assertEqual(connection.execute(
+                'SELECT message_id, author_id, data FROM messages ORDER BY timestamp').fetchall(),
+                [(str(index), str(index % 2), '{"is_moderator":false}') for index in range(5)])
+            self.assertEqual(connection.execute(
+                'SELECT id, name FROM authors ORDER BY id').fetchall(),
+                [('0', 'name 4'), ('1', 'name 3')])
+            connection.close()
+
+    def test_rotation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            completed = []
+            path = os.path.join(tmp, 'test_{index:02}.jsonl')
+            with ContinuousWriter(path, rotate_items=2, on_segment_complete=completed.append) as writer:
+                for i in range(5):
+                    writer.write({'i': i})
+
+                # The current segment is only renamed once complete
+                self.assertEqual(sorted(os.listdir(tmp)), [
+                    'test_00.jsonl', 'test_01.jsonl', 'test_02.jsonl.part'])
+
+            names = [os.path.join(tmp, f'test_{i:02}.jsonl') for i in range(3)]
+            self.assertEqual(completed, names)
+
+            with open(names[-1], encoding='utf-8') as f:
+                self.assertEqual(f.read(), '{"i":4}\n')
+
+        # Names are only formatted if they contain a rotation field, and the
+        # start time is in UTC, like the boundaries of the interval
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, '{x}.jsonl')
+            with ContinuousWriter(path, rotate_items=1) as writer:
+                writer.write({'i': 0})
+            self.assertEqual(os.listdir(tmp), ['{x}.jsonl'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, '{{x}}_{start:%H}.jsonl')
+            hour = time.gmtime().tm_hour
+            with ContinuousWriter(path, rotate_interval=3600) as writer:
+                writer.write({'i': 0})
+            self.assertIn(os.listdir(tmp), (
+                [f'{{x}}_{hour:02}.jsonl'], [f'{{x}}_{(hour + 1) % 24:02}.jsonl']))
+
+        # The size of rows which are held in a spool file is counted too
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.csv')
+            with ContinuousWriter(path, rotate_bytes=200, flush_every=1) as writer:
+                for i in range(20):
+                    writer.write({'message': 'x' * 20})
+
+            self.assertGreater(len(os.listdir(tmp)), 1)
+
+    def test_multi_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f'test.{extension}')
+                     for extension in ('txt', 'jsonl', 'csv')]
+            writers = [ContinuousWriter(path) for path in paths]
+
+            with MultiWriter(writers) as writer:
+                writer.write(SharedItem({'a': 1}, lambda item: f"a={item['a']}"))
+
+                # An error in one writer does not affect the others
+                writers[1].writer.file.close()
+                writer.write({'a': 2})
+                self.assertEqual(writer.active_writers, [writers[0], writers[2]])
+
+            with open(paths[0], encoding='utf-8') as f:
+                self.assertEqual(f.read(), "a=1\n{'a': 2}\n")
+            with open(paths[1], encoding='utf-8') as f:
+                self.assertEqual(f.read(), '{"a":1}\n')
+            with open(paths[2], encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), ['a', '1', '2'])